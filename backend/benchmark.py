@@ -0,0 +1,187 @@
+"""
+Micro-benchmarks for the hot paths in ml_service.
+
+Usage (from the backend directory):
+    python benchmark.py            # run every benchmark
+    python benchmark.py aqi        # run a single benchmark
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import compact
+import ml_service as ms
+from tree_eval import NumpyForest
+
+
+def timeit(fn, repeat=5, number=1):
+    """Best-of-``repeat`` wall time per call in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best * 1000
+
+
+def report(label, before_ms, after_ms):
+    print(f"  {label:<32} before {before_ms:9.3f} ms   after {after_ms:8.3f} ms   x{before_ms / after_ms:7.1f}")
+
+
+def bench_aqi():
+    print("AQI conversion (scalar list comprehension vs array version)")
+    rng = np.random.default_rng(0)
+    for label, n in [("168 h, 1 site", 168), ("168 h, 400 sites", 168 * 400)]:
+        pm = rng.gamma(2.0, 8.0, n)
+        o3 = rng.gamma(4.0, 10.0, n)
+        no2 = rng.gamma(2.0, 15.0, n)
+        pm[::97] = np.nan
+
+        def loop():
+            [ms.aqi_from_pm25(v) for v in pm]
+            [ms.aqi_from_o3(v) for v in o3]
+            [ms.aqi_from_no2_ppb(v) for v in no2]
+
+        def array():
+            ms.aqi_from_pm25_array(pm)
+            ms.aqi_from_o3_array(o3)
+            ms.aqi_from_no2_ppb_array(no2)
+
+        number = 20 if n < 1000 else 1
+        report(label, timeit(loop, number=number), timeit(array, number=number))
+
+
+def bench_payload():
+    print("Map payload encoding (row dicts via FastAPI encoder vs columnar)")
+    from fastapi.encoders import jsonable_encoder
+    import json
+
+    rng = np.random.default_rng(0)
+    for label, n in [("20x20 grid", 400), ("64x64 grid", 4096)]:
+        columns = {
+            "lat": np.round(rng.uniform(30, 50, n), 4),
+            "lon": np.round(rng.uniform(-125, -70, n), 4),
+            "aqi": rng.integers(0, 300, n),
+            "resolution": 0.1,
+        }
+
+        def rows():
+            data = [
+                {"lat": lat, "lon": lon, "aqi": value, "intensity": value / 500}
+                for lat, lon, value in zip(columns["lat"].tolist(), columns["lon"].tolist(), columns["aqi"].tolist())
+            ]
+            return json.dumps(jsonable_encoder({"data": data, "resolution": 0.1})).encode()
+
+        def columnar():
+            return compact.encode_response(compact.map_columns(columns)).body
+
+        print(f"  {label}: {len(rows()):,} bytes -> {len(columnar()):,} bytes")
+        report(label, timeit(rows, number=5), timeit(columnar, number=5))
+
+
+def bench_parse():
+    print("Open-Meteo hourly parsing (json + datetime strings vs fast decode + arithmetic index)")
+    import json
+
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp.now(tz="UTC").floor("D")
+    for label, hours in [("72 h forecast", 72), ("168 h forecast", 168), ("90 day history", 90 * 24)]:
+        names = ms.METEO_VARS if hours <= 168 else ["pm2_5", "ozone", "nitrogen_dioxide"]
+        times = pd.date_range(start, periods=hours, freq="h").strftime("%Y-%m-%dT%H:%M").tolist()
+        hourly = {"time": times, **{name: np.round(rng.gamma(2.0, 8.0, hours), 1).tolist() for name in names}}
+        hourly[names[0]][5] = None
+        body = json.dumps({"latitude": 40.7, "longitude": -74.0, "hourly": hourly}).encode()
+
+        def strings():
+            return ms._parse_hourly_strings(json.loads(body)["hourly"])
+
+        def arithmetic():
+            return ms.parse_hourly(ms.decode_json(body))
+
+        pd.testing.assert_frame_equal(strings(), arithmetic(), check_index_type=False, check_freq=False)
+        report(f"{label} ({len(body) // 1024} KiB)", timeit(strings, number=20), timeit(arithmetic, number=20))
+
+
+def synthetic_inputs(rng, forecast_hours=96, hist_hours=72):
+    """Meteo forecast and AQ history frames shaped like the upstream parsers' output"""
+    now = pd.Timestamp.now(tz="UTC").floor("h")
+    met_index = pd.date_range(now.floor("D"), periods=forecast_hours, freq="h", name="time")
+    met = pd.DataFrame({name: rng.normal(10, 3, len(met_index)) for name in ms.METEO_VARS}, index=met_index)
+    met["wind_direction_10m"] = rng.uniform(0, 360, len(met_index))
+    hist_index = pd.date_range(now - pd.Timedelta(hours=hist_hours), now.floor("D") + pd.Timedelta(hours=23), freq="h", name="time")
+    hist = {
+        name: pd.DataFrame({name: rng.gamma(2.0, 8.0, len(hist_index))}, index=hist_index)
+        for name in ["pm25", "o3", "no2"]
+    }
+    hist["pm25"].iloc[::17] = np.nan
+    return met, hist
+
+
+def bench_features():
+    print("Feature matrices (make_hourly_features per target vs compiled float32 plan)")
+    if not ms.MODELS_LOADED:
+        print("  skipped: models not loaded")
+        return
+    rng = np.random.default_rng(0)
+    for label, hours in [("72 h forecast", 96), ("168 h forecast", 192)]:
+        met, hist = synthetic_inputs(rng, forecast_hours=hours)
+
+        def per_target():
+            pm = ms.make_hourly_features(hist["pm25"], met)[ms.pm_feats].ffill(limit=2)
+            o3 = ms.make_hourly_features(hist["o3"], met)[ms.o3_feats].ffill(limit=2)
+            return pm, o3
+
+        def planned():
+            return ms.build_feature_matrices(hist, met)
+
+        (pm_ref, o3_ref), (pm_X, o3_X) = per_target(), planned()
+        for expected, actual in [(pm_ref, pm_X), (o3_ref, o3_X)]:
+            np.testing.assert_array_equal(expected.to_numpy(dtype=np.float32), actual)
+        drift = max(
+            np.abs(ms.pm_model.predict(pm_ref) - ms.pm_model.predict(pm_X)).max(),
+            np.abs(ms.o3_model.predict(o3_ref) - ms.o3_model.predict(o3_X)).max(),
+        )
+        report(label, timeit(per_target, number=20), timeit(planned, number=20))
+        print(f"  {'':<32} max prediction change from float32 inputs: {drift:.2e}")
+
+
+def bench_predict():
+    print("Model inference (LightGBM sklearn predict vs NumpyForest)")
+    if not ms.MODELS_LOADED:
+        print("  skipped: models not loaded")
+        return
+    rng = np.random.default_rng(0)
+    met, hist = synthetic_inputs(rng, forecast_hours=96)
+    site_X = dict(zip(["pm25", "o3"], ms.build_feature_matrices(hist, met)))
+    for name, model in [("pm25", ms.pm_model), ("o3", ms.o3_model)]:
+        forest = NumpyForest(model.booster_)
+        single = site_X[name]
+        # 400 sites: the site rows jittered per site, with some missing values
+        batched = np.repeat(single, 400, axis=0) * rng.uniform(0.8, 1.2, (400 * len(single), 1)).astype(np.float32)
+        batched[rng.random(batched.shape) < 0.01] = np.nan
+        for X in (single, batched):
+            np.testing.assert_array_equal(model.predict(X), forest.predict(X))
+        report(f"{name} 1 site ({len(single)} rows)",
+               timeit(lambda: model.predict(single), number=50), timeit(lambda: forest.predict(single), number=50))
+        report(f"{name} 400 sites ({len(batched)} rows)",
+               timeit(lambda: model.predict(batched), repeat=3), timeit(lambda: forest.predict(batched), repeat=3))
+
+
+BENCHMARKS = {
+    "aqi": bench_aqi,
+    "payload": bench_payload,
+    "parse": bench_parse,
+    "features": bench_features,
+    "predict": bench_predict,
+}
+
+
+if __name__ == "__main__":
+    ms.load_models()
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
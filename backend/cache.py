@@ -0,0 +1,439 @@
+import ast
+import asyncio
+import io
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+# "memory" keeps every cache in-process only. "sqlite" shares them between
+# the worker processes on one host through SHARED_CACHE_PATH, with a small
+# in-process tier; "persistent" keeps the full budget in memory and writes
+# through to the same database. Both survive restarts: entries still valid
+# are reloaded in the background at startup (warm_caches).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_store", "cache.sqlite3"),
+)
+SHARED_CACHE_LOCAL_FRACTION = {"sqlite": 0.125, "persistent": 1.0}
+CACHE_WARM_BATCH = 64
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate in-memory footprint of a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (dict, list)):
+        try:
+            return len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            pass
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry and a memory budget.
+
+    Entries are evicted least-recently-used first once the estimated size of
+    all values exceeds ``max_bytes``. Not thread-safe: use from the event loop.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Any:
+        entry = self._entries.get(key)
+        now = time.time() if now is None else now
+        if entry is None or entry[1] <= now:
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, expires_at: float, size: Optional[int] = None):
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _drop(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one in-flight task.
+
+    The first caller starts the task; callers arriving while it runs await the
+    same task and receive the same result object (or exception).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def join(self, key: Hashable) -> Optional[asyncio.Task]:
+        """In-flight task for ``key``, if any"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        return task
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self.join(key)
+        if task is not None:
+            return task
+        task = asyncio.ensure_future(self._run(key, fn))
+        task.add_done_callback(_consume_exception)
+        self._inflight[key] = task
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # Shield so a cancelled waiter does not cancel the call shared with others
+        return await asyncio.shield(self.start(key, fn))
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fn()
+        finally:
+            self._inflight.pop(key, None)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+class StaleWhileRevalidateCache:
+    """Cache of computed results with stale-while-revalidate semantics.
+
+    Fresh entries are returned directly. Stale entries (older than
+    ``fresh_seconds`` but within ``stale_seconds`` after that) are returned
+    immediately while a single background task recomputes them. Concurrent
+    misses for the same key share one computation.
+    """
+
+    def __init__(self, name: str, max_bytes: int, fresh_seconds: float, stale_seconds: float):
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self._store = make_cache(name, max_bytes)
+        self._flights = SingleFlight()
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        now = time.time()
+        entry = self._store.get(key, now)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until <= now:
+                self.stale_hits += 1
+                if not self._flights.running(key):
+                    self.refreshes += 1
+                    self._flights.start(key, lambda: self._compute_and_store(key, compute))
+            return value
+        return await self._flights.do(key, lambda: self._compute_and_store(key, compute))
+
+    def peek(self, key: Hashable) -> Any:
+        """Fresh value for ``key`` without triggering a computation, else None"""
+        now = time.time()
+        entry = self._store.get(key, now)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        now = time.time()
+        self._store.set(
+            key,
+            (value, now + self.fresh_seconds),
+            expires_at=now + self.fresh_seconds + self.stale_seconds,
+            size=estimate_size(value),
+        )
+
+    async def _compute_and_store(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        value = await compute()
+        self.put(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._store.stats(),
+            "stale_hits": self.stale_hits,
+            "coalesced": self._flights.shared,
+            "refreshes": self.refreshes,
+            "inflight": len(self._flights),
+        }
+
+
+class SharedCache:
+    """TTLCache-compatible cache shared by the processes of one host.
+
+    Entries live in a SQLite database (WAL mode) so every worker sees values
+    stored by the others; a small in-process TTLCache in front keeps repeated
+    hits free of deserialization. Values are pickled, with DataFrames stored
+    as raw column arrays (see _dumps). When the database grows past
+    ``max_bytes``, entries expiring soonest are evicted first. Like TTLCache,
+    use from the event loop only; each process opens its own connection.
+    """
+
+    def __init__(self, name: str, max_bytes: int, path: str = SHARED_CACHE_PATH, local_fraction: float = 0.125):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.path = path
+        self._local = TTLCache(name, int(max_bytes * local_fraction))
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.warmed = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Connections must not cross fork(): reopen in each process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (cache TEXT, key TEXT, value BLOB, "
+                "expires_at REAL, size INTEGER, PRIMARY KEY (cache, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_expiry ON entries (cache, expires_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Any:
+        now = time.time() if now is None else now
+        value = self._local.get(key, now)
+        if value is not None:
+            self.hits += 1
+            return value
+        row = self._db().execute(
+            "SELECT value, expires_at, size FROM entries WHERE cache = ? AND key = ? AND expires_at > ?",
+            (self.name, repr(key), now),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = _loads(row[0])
+        self._local.set(key, value, expires_at=row[1], size=row[2])
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float, size: Optional[int] = None):
+        blob = _dumps(value)
+        if len(blob) > self.max_bytes:
+            return
+        self._local.set(key, value, expires_at=expires_at, size=size)
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (self.name, repr(key), blob, expires_at, len(blob)),
+        )
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._trim(db)
+
+    async def warm(self) -> int:
+        """Reload still-valid entries into the in-process tier, freshest first.
+
+        Runs in small batches so the event loop keeps serving; entries that do
+        not fit are still found lazily through the database on ``get``.
+        """
+        db = self._db()
+        now = time.time()
+        db.execute("DELETE FROM entries WHERE cache = ? AND expires_at <= ?", (self.name, now))
+        rows = db.execute(
+            "SELECT key, expires_at, size FROM entries WHERE cache = ? AND expires_at > ? ORDER BY expires_at DESC",
+            (self.name, now),
+        ).fetchall()
+        budget = self._local.max_bytes
+        for start in range(0, len(rows), CACHE_WARM_BATCH):
+            for key_repr, expires_at, size in rows[start:start + CACHE_WARM_BATCH]:
+                if size > budget:
+                    return self.warmed
+                try:
+                    key = ast.literal_eval(key_repr)
+                except (ValueError, SyntaxError):
+                    continue
+                row = db.execute(
+                    "SELECT value FROM entries WHERE cache = ? AND key = ?", (self.name, key_repr)
+                ).fetchone()
+                if row is None or expires_at <= time.time():
+                    continue
+                self._local.set(key, _loads(row[0]), expires_at=expires_at, size=size)
+                budget -= size
+                self.warmed += 1
+            await asyncio.sleep(0)
+        return self.warmed
+
+    def _trim(self, db: sqlite3.Connection):
+        db.execute("DELETE FROM entries WHERE cache = ? AND expires_at <= ?", (self.name, time.time()))
+        excess = self._bytes(db) - self.max_bytes
+        if excess <= 0:
+            return
+        rows = db.execute(
+            "SELECT key, size FROM entries WHERE cache = ? ORDER BY expires_at", (self.name,)
+        ).fetchall()
+        victims = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((self.name, key))
+            excess -= size
+        db.executemany("DELETE FROM entries WHERE cache = ? AND key = ?", victims)
+        self.evictions += len(victims)
+
+    def _bytes(self, db: sqlite3.Connection) -> int:
+        return db.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE cache = ?", (self.name,)).fetchone()[0]
+
+    def clear(self):
+        self._local.clear()
+        self._db().execute("DELETE FROM entries WHERE cache = ?", (self.name,))
+
+    def __len__(self):
+        return self._db().execute("SELECT COUNT(*) FROM entries WHERE cache = ?", (self.name,)).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "backend": CACHE_BACKEND,
+            "entries": len(self),
+            "bytes": self._bytes(self._db()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "warmed": self.warmed,
+            "local": self._local.stats(),
+        }
+
+
+_shared_caches = []
+
+
+def make_cache(name: str, max_bytes: int):
+    """Cache for the configured CACHE_BACKEND"""
+    if CACHE_BACKEND in SHARED_CACHE_LOCAL_FRACTION:
+        cache = SharedCache(name, max_bytes, local_fraction=SHARED_CACHE_LOCAL_FRACTION[CACHE_BACKEND])
+        _shared_caches.append(cache)
+        return cache
+    return TTLCache(name, max_bytes)
+
+
+async def warm_caches():
+    """Warm every database-backed cache from disk (no-op for the memory backend)"""
+    for cache in _shared_caches:
+        try:
+            warmed = await cache.warm()
+        except Exception as e:
+            print(f"Cache warm-up for {cache.name} failed: {e}")
+            continue
+        print(f"Cache {cache.name}: {warmed} entries reloaded from {cache.path}")
+
+
+class _CompactPickler(pickle.Pickler):
+    """Pickles DataFrames with a datetime index as raw column arrays"""
+
+    def reducer_override(self, obj):
+        if type(obj) is pd.DataFrame and isinstance(obj.index, pd.DatetimeIndex) and obj.columns.is_unique:
+            if all(dtype.kind in "fiub" for dtype in obj.dtypes):
+                return _frame_from_arrays, _frame_arrays(obj)
+        return NotImplemented
+
+
+def _frame_arrays(frame: pd.DataFrame):
+    index = frame.index
+    unit = index.unit
+    ticks = index.asi8
+    steps = np.diff(ticks)
+    # Regular grids (the usual hourly series) are stored as start/step/length
+    if len(ticks) > 1 and (steps == steps[0]).all():
+        time_axis = (int(ticks[0]), int(steps[0]), len(ticks))
+    else:
+        time_axis = ticks.tobytes()
+    columns = [(name, frame[name].dtype.str, frame[name].to_numpy().tobytes()) for name in frame.columns]
+    return (time_axis, unit, str(index.tz) if index.tz else None, index.name, columns)
+
+
+def _frame_from_arrays(time_axis, unit, tz, index_name, columns):
+    if isinstance(time_axis, tuple):
+        start, step, n = time_axis
+        ticks = start + step * np.arange(n, dtype=np.int64)
+    else:
+        ticks = np.frombuffer(time_axis, dtype=np.int64)
+    index = pd.DatetimeIndex(ticks.view(f"M8[{unit}]"), name=index_name)
+    if tz is not None:
+        index = index.tz_localize(tz)
+    data = {name: np.frombuffer(raw, dtype=np.dtype(dtype)).copy() for name, dtype, raw in columns}
+    return pd.DataFrame(data, index=index, columns=[name for name, _, _ in columns])
+
+
+def _dumps(value: Any) -> bytes:
+    buffer = io.BytesIO()
+    _CompactPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+    return buffer.getvalue()
+
+
+def _loads(blob: bytes) -> Any:
+    # Only this service writes the shared database
+    return pickle.loads(blob)
+
+
+def _consume_exception(task: asyncio.Task):
+    # Failures are re-raised to the awaiting callers; background refreshes
+    # are simply retried on the next stale hit
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,110 @@
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+# Optional fast/binary encoders
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("orjson not available - compact responses use the standard json module")
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+COLUMNAR = "columnar"
+
+FORECAST_COLUMNS = ["timestamp", "aqi", "pm25", "o3_ppb", "no2_ppb", "confidence"]
+
+
+def map_columns(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Columnar /api/map/data payload; intensity is aqi / 500 and left to the client"""
+    return {
+        "format": COLUMNAR,
+        "resolution": columns["resolution"],
+        "lat": columns["lat"].tolist(),
+        "lon": columns["lon"].tolist(),
+        "aqi": columns["aqi"].tolist(),
+    }
+
+
+def forecast_columns(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Columnar form of a formatted forecast payload.
+
+    Per-hour fields become arrays; category name/color and dominant pollutant
+    are stored once in lookup tables and referenced by index.
+    """
+    rows = payload["forecast"]
+    categories, category_codes = _codes(rows, lambda row: (row["category"], row["categoryColor"]))
+    pollutants, pollutant_codes = _codes(rows, lambda row: row["dominantPollutant"])
+    columns = {name: [row[name] for row in rows] for name in FORECAST_COLUMNS}
+    return {
+        **{key: value for key, value in payload.items() if key != "forecast"},
+        "format": COLUMNAR,
+        "categories": [{"name": name, "color": color} for name, color in categories],
+        "pollutants": pollutants,
+        "forecast": {**columns, "category": category_codes, "dominantPollutant": pollutant_codes},
+    }
+
+
+def _codes(rows, key):
+    table, index, codes = [], {}, []
+    for row in rows:
+        value = key(row)
+        if value not in index:
+            index[value] = len(table)
+            table.append(value)
+        codes.append(index[value])
+    return table, codes
+
+
+def accept_quality(accept: str, media_type: str, wildcards: bool = True) -> float:
+    """q value the Accept header gives ``media_type`` (most specific matching range wins)"""
+    kind = media_type.split("/")[0]
+    best, quality = -1, 0.0
+    for part in accept.split(","):
+        media, *params = [item.strip() for item in part.split(";")]
+        media = media.lower()
+        if media == media_type:
+            specificity = 2
+        elif wildcards and media in (f"{kind}/*", "*/*"):
+            specificity = 1 if media != "*/*" else 0
+        else:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if specificity > best:
+            best, quality = specificity, q
+    return quality
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """MessagePack only when explicitly accepted (q > 0) and not ranked below JSON"""
+    if not (MSGPACK_AVAILABLE and accept):
+        return False
+    msgpack_q = max(accept_quality(accept, media, wildcards=False) for media in MSGPACK_MEDIA_TYPES)
+    return msgpack_q > 0 and msgpack_q >= accept_quality(accept, "application/json")
+
+
+def encode_response(payload: Any, accept: Optional[str] = None) -> Response:
+    """Pre-encoded response: MessagePack when accepted and installed, else compact JSON"""
+    headers = {"Vary": "Accept"}
+    if wants_msgpack(accept):
+        return Response(msgpack.packb(payload), media_type="application/x-msgpack", headers=headers)
+    if ORJSON_AVAILABLE:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+    return Response(body, media_type="application/json", headers=headers)
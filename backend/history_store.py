@@ -0,0 +1,214 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; single-process use only there
+    fcntl = None
+
+from cache import SingleFlight
+from ml_service import (
+    AQ_API, O3_UGM3_TO_PPB, NO2_UGM3_TO_PPB, UPSTREAM_GRID_DEG,
+    fetch_openmeteo_aq_history_chunked, forecast_frame, snap_coord, upstream_bucket,
+)
+
+# Hourly CAMS pollutant history kept on local disk, partitioned by 0.1 degree
+# cell and calendar month: <HISTORY_DIR>/<lat>_<lon>/<YYYY-MM>.npz holding
+# epoch hours (int32) and pm25/o3/no2 in ug/m3 (float32). Cells are ingested
+# from the archive API on first use and only the missing head/tail is fetched
+# afterwards, at most once per upstream bucket. Writers hold a per-cell flock
+# so several worker processes can ingest the same cell safely.
+HISTORY_DIR = os.getenv("HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history_store"))
+HISTORY_GRID_DEG = UPSTREAM_GRID_DEG[AQ_API]
+HISTORY_MAX_HOURS = int(os.getenv("HISTORY_MAX_HOURS", str(366 * 24)))
+HISTORY_COLUMNS = ["pm25", "o3", "no2"]
+
+
+def to_hours(index):
+    """Epoch hours for a UTC DatetimeIndex"""
+    return (index.as_unit("s").asi8 // 3600).astype(np.int64)
+
+
+def from_hours(hours):
+    return pd.to_datetime(np.asarray(hours, dtype=np.int64) * 3600, unit="s", utc=True)
+
+
+def current_hour(now=None):
+    now = datetime.now(timezone.utc) if now is None else now
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+class HistoryStore:
+    """Hourly pollutant history on disk, one .npz file per cell and month."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._ensured = {}
+        self._flights = SingleFlight()
+
+    def cell(self, lat: float, lon: float):
+        return snap_coord(lat, HISTORY_GRID_DEG), snap_coord(lon, HISTORY_GRID_DEG)
+
+    def _cell_dir(self, cell):
+        return os.path.join(self.root, f"{cell[0]:.1f}_{cell[1]:.1f}")
+
+    def _months(self, cell):
+        try:
+            names = os.listdir(self._cell_dir(cell))
+        except FileNotFoundError:
+            return []
+        # "YYYY-MM.npz" only; skips in-progress "<month>.npz.<pid>.tmp.npz" writes
+        return sorted(name[:-4] for name in names if name.endswith(".npz") and len(name) == 11)
+
+    def _load(self, cell, month):
+        path = os.path.join(self._cell_dir(cell), f"{month}.npz")
+        try:
+            with np.load(path) as npz:
+                return {name: npz[name] for name in ["time", *HISTORY_COLUMNS]}
+        except FileNotFoundError:
+            return None
+
+    def _save(self, cell, month, arrays):
+        directory = self._cell_dir(cell)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{month}.npz")
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @contextmanager
+    def _locked(self, cell):
+        """Exclusive lock on the cell across processes (load-merge-save sections)"""
+        directory = self._cell_dir(cell)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def coverage(self, cell):
+        """(first_hour, last_hour) stored for the cell, or None if empty.
+
+        Read from disk every time: other processes may have extended it.
+        """
+        months = self._months(cell)
+        if not months:
+            return None
+        first, last = self._load(cell, months[0]), self._load(cell, months[-1])
+        return int(first["time"][0]), int(last["time"][-1])
+
+    def append(self, cell, frame: pd.DataFrame) -> int:
+        """Merge hourly rows (UTC index, HISTORY_COLUMNS) into the store; newer values win"""
+        if frame.empty:
+            return 0
+        frame = frame.reindex(columns=HISTORY_COLUMNS)
+        with self._locked(cell):
+            self._merge(cell, frame)
+        return len(frame)
+
+    def _merge(self, cell, frame):
+        hours = to_hours(frame.index)
+        months = frame.index.strftime("%Y-%m")
+        for month in np.unique(months):
+            rows = months == month
+            new = {"time": hours[rows].astype(np.int32)}
+            new.update({name: frame[name].to_numpy(dtype=np.float32)[rows] for name in HISTORY_COLUMNS})
+            old = self._load(cell, month)
+            if old is not None:
+                new = {name: np.concatenate([old[name], new[name]]) for name in new}
+            # Stable sort keeps later (newer) duplicates after older ones; keep the last
+            order = np.argsort(new["time"], kind="stable")
+            new = {name: values[order] for name, values in new.items()}
+            keep = np.r_[new["time"][1:] != new["time"][:-1], True]
+            self._save(cell, month, {name: values[keep] for name, values in new.items()})
+
+    def read(self, lat: float, lon: float, start: datetime, end: datetime) -> pd.DataFrame:
+        """Stored hours in [start, end] as a DataFrame of pm25/o3/no2 in ug/m3"""
+        cell = self.cell(lat, lon)
+        start_hour, end_hour = int(start.timestamp() // 3600), int(end.timestamp() // 3600)
+        first_month, last_month = start.strftime("%Y-%m"), end.strftime("%Y-%m")
+        parts = []
+        for month in self._months(cell):
+            if first_month <= month <= last_month:
+                arrays = self._load(cell, month)
+                rows = (arrays["time"] >= start_hour) & (arrays["time"] <= end_hour)
+                parts.append({name: values[rows] for name, values in arrays.items()})
+        if not parts:
+            return pd.DataFrame(columns=HISTORY_COLUMNS, index=from_hours([]), dtype=float)
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        return pd.DataFrame(
+            {name: columns[name].astype(float) for name in HISTORY_COLUMNS},
+            index=from_hours(columns["time"]),
+        )
+
+    async def ensure(self, lat: float, lon: float, start: datetime, end: datetime):
+        """Ingest whatever part of [start, end] the store is missing for the cell.
+
+        Returns the failed fetch chunks (dicts with start_date/end_date/error);
+        an empty list means the stored range is as complete as upstream has it.
+        """
+        cell = self.cell(lat, lon)
+        bucket = upstream_bucket()
+        ensured = self._ensured.get(cell)
+        if ensured is not None and ensured[0] == bucket and ensured[1] <= start:
+            return []
+        return await self._flights.do((cell, start), lambda: self._ingest(cell, start, end, bucket))
+
+    async def _ingest(self, cell, start, end, bucket):
+        end = min(end, current_hour())
+        coverage = self.coverage(cell)
+        if coverage is None:
+            ranges = [(start, end)]
+        else:
+            first, last = from_hours(coverage)
+            ranges = []
+            if start < first:
+                ranges.append((start, first - timedelta(hours=1)))
+            if end > last:
+                ranges.append((last + timedelta(hours=1), end))
+
+        appended, failed = 0, []
+        for range_start, range_end in ranges:
+            (hist,), failures = await fetch_openmeteo_aq_history_chunked(
+                range_start, range_end + timedelta(hours=1), [cell]
+            )
+            # A partial range would leave a gap hidden inside the coverage; retry it later
+            if failures:
+                print(f"History ingestion for {cell} skipped, {len(failures)} chunk(s) failed: {failures[0]['error']}")
+                failed.extend(failures)
+                continue
+            frames = [frame for frame in hist.values() if not frame.empty]
+            if not frames:
+                continue
+            frame = pd.concat(frames, axis=1)
+            # Requests are whole days; today's rows past the current hour are forecasts
+            frame = frame[frame.index <= end]
+            appended += self.append(cell, frame)
+
+        # Failed ranges are retried by the next request instead of waiting a bucket
+        if (appended or not ranges) and not failed:
+            self._ensured[cell] = (bucket, start)
+        return failed
+
+    async def query(self, lat: float, lon: float, start: datetime, end: datetime):
+        """Stored rows for [start, end] after ingestion, and the chunks that failed to ingest"""
+        failures = await self.ensure(lat, lon, start, end)
+        return self.read(lat, lon, start, end), failures
+
+
+history_store = HistoryStore(HISTORY_DIR)
+
+
+def history_frame(history: pd.DataFrame) -> pd.DataFrame:
+    """AQI frame (same columns as forecast_frame) for stored history, hours without data dropped"""
+    frame = forecast_frame(
+        history.index,
+        history["pm25"].to_numpy(),
+        history["o3"].to_numpy() * O3_UGM3_TO_PPB,
+        history["no2"].to_numpy() * NO2_UGM3_TO_PPB,
+    )
+    return frame[frame["aqi"].notna()]
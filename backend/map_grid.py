@@ -0,0 +1,188 @@
+import math
+import os
+
+import numpy as np
+
+from cache import make_cache
+from ml_service import (
+    AQ_API, O3_UGM3_TO_PPB, NO2_UGM3_TO_PPB, UPSTREAM_REFRESH_SECONDS,
+    aqi_from_pm25_array, aqi_from_o3_array, aqi_from_no2_ppb_array,
+    fetch_upstream_many, upstream_bucket,
+)
+
+# The map grid is a global lattice of cells whose size doubles per level,
+# starting at the CAMS grid resolution. Cells are grouped into square tiles
+# of MAP_TILE_CELLS x MAP_TILE_CELLS which are computed and cached as a unit,
+# so panning or re-requesting overlapping bounds reuses already-seen tiles.
+MAP_BASE_STEP = 0.1
+MAP_MAX_LEVEL = 9
+MAP_TILE_CELLS = 8
+MAP_CACHE_MB = int(os.getenv("MAP_CACHE_MB", "32"))
+# Request limits: longitudes may run past +-180 (panned world copies) but only
+# up to MAP_MAX_ABS_LON, and at most MAP_MAX_CELLS cells are computed per request
+MAP_MAX_ABS_LON = 3600.0
+MAP_MAX_CELLS = int(os.getenv("MAP_MAX_CELLS", "5000"))
+
+MAP_AQ_PARAMS = {"current": "pm2_5,ozone,nitrogen_dioxide", "timezone": "UTC"}
+
+map_tile_cache = make_cache("map_tiles", MAP_CACHE_MB * 1024 * 1024)
+
+
+def grid_level(north, south, east, west, grid_size):
+    """Coarsest-needed lattice level giving at most ~grid_size cells across the bounds"""
+    span = max(north - south, east - west, MAP_BASE_STEP)
+    level = math.ceil(math.log2(span / (grid_size * MAP_BASE_STEP)))
+    return min(max(level, 0), MAP_MAX_LEVEL)
+
+
+def normalize_bounds(north, south, east, west):
+    """Validated bounds with west wrapped into [-180, 180) and at most 360 degrees of longitude.
+
+    Returns (north, south, east, west, lon_offset), where lon_offset maps the
+    wrapped longitudes back onto the caller's; raises ValueError for invalid bounds.
+    """
+    if not all(math.isfinite(v) for v in (north, south, east, west)):
+        raise ValueError("Bounds must be finite")
+    if not -90 <= south < north <= 90:
+        raise ValueError("Latitude bounds must satisfy -90 <= south < north <= 90")
+    if not -MAP_MAX_ABS_LON <= west < east <= MAP_MAX_ABS_LON:
+        raise ValueError(f"Longitude bounds must satisfy -{MAP_MAX_ABS_LON:g} <= west < east <= {MAP_MAX_ABS_LON:g}")
+    span = min(east - west, 360.0)
+    wrapped = west if -180 <= west < 180 else (west + 180) % 360 - 180
+    return north, south, wrapped + span, wrapped, west - wrapped
+
+
+def level_step(level):
+    return MAP_BASE_STEP * 2 ** level
+
+
+def _tile_axes(level, ty, tx):
+    step = level_step(level)
+    cells = np.arange(MAP_TILE_CELLS)
+    lats = np.round((ty * MAP_TILE_CELLS + cells) * step, 4)
+    lons = np.round((tx * MAP_TILE_CELLS + cells) * step, 4)
+    return lats, lons
+
+
+async def get_aqi_grid(north: float, south: float, east: float, west: float, grid_size: int = 20):
+    """AQI heatmap cells for the bounds, computed from current CAMS data"""
+    columns = await get_aqi_grid_columns(north, south, east, west, grid_size)
+    return {
+        "data": [
+            {"lat": lat, "lon": lon, "aqi": value, "intensity": value / 500}
+            for lat, lon, value in zip(columns["lat"].tolist(), columns["lon"].tolist(), columns["aqi"].tolist())
+        ],
+        "resolution": columns["resolution"],
+    }
+
+
+async def get_aqi_grid_columns(north: float, south: float, east: float, west: float, grid_size: int = 20):
+    """Same cells as get_aqi_grid as parallel lat/lon/aqi arrays.
+
+    Raises ValueError for invalid bounds (see normalize_bounds) or too many cells.
+    """
+    north, south, east, west, lon_offset = normalize_bounds(north, south, east, west)
+    level = grid_level(north, south, east, west, grid_size)
+    step = level_step(level)
+    # Lattice rows/columns strictly inside the bounds (epsilon absorbs float noise)
+    i0, i1 = math.ceil(max(south, -90) / step - 1e-9), math.floor(min(north, 90) / step + 1e-9)
+    j0, j1 = math.ceil(west / step - 1e-9), math.floor(east / step + 1e-9)
+    if east - west >= 360:
+        # The whole globe: the east edge is the west edge again
+        j1 = min(j1, j0 + round(360 / step) - 1)
+    if i1 < i0 or j1 < j0:
+        empty = np.empty(0)
+        return {"lat": empty, "lon": empty, "aqi": empty.astype(int), "resolution": step}
+    if (i1 - i0 + 1) * (j1 - j0 + 1) > MAP_MAX_CELLS:
+        raise ValueError(f"Bounds cover more than {MAP_MAX_CELLS} cells, use a smaller grid_size")
+
+    aqi, _ = await aqi_lattice(level, i0, i1, j0, j1)
+    lats = np.round(np.arange(i0, i1 + 1) * step, 4)
+    lons = np.round(np.arange(j0, j1 + 1) * step + lon_offset, 4)
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+    keep = ~np.isnan(aqi)
+    return {
+        "lat": lat_grid[keep],
+        "lon": lon_grid[keep],
+        "aqi": np.round(aqi[keep]).astype(int),
+        "resolution": step,
+    }
+
+
+async def aqi_lattice(level, i0, i1, j0, j1):
+    """AQI for lattice rows i0..i1 and columns j0..j1 (inclusive) at ``level``.
+
+    Assembled from cached tiles; cells off the globe or without data are NaN.
+    Returns the grid and whether every tile was computed without upstream errors.
+    """
+    ty0, ty1 = i0 // MAP_TILE_CELLS, i1 // MAP_TILE_CELLS
+    tx0, tx1 = j0 // MAP_TILE_CELLS, j1 // MAP_TILE_CELLS
+    tiles = [(level, ty, tx) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+
+    bucket = upstream_bucket()
+    grids = {tile: map_tile_cache.get((*tile, bucket)) for tile in tiles}
+    missing = [tile for tile, grid in grids.items() if grid is None]
+    complete = True
+    if missing:
+        computed, complete = await _compute_tiles(missing, bucket)
+        grids.update(computed)
+
+    full = np.empty(((ty1 - ty0 + 1) * MAP_TILE_CELLS, (tx1 - tx0 + 1) * MAP_TILE_CELLS))
+    for _, ty, tx in tiles:
+        r, c = (ty - ty0) * MAP_TILE_CELLS, (tx - tx0) * MAP_TILE_CELLS
+        full[r:r + MAP_TILE_CELLS, c:c + MAP_TILE_CELLS] = grids[(level, ty, tx)]
+    r0, c0 = i0 - ty0 * MAP_TILE_CELLS, j0 - tx0 * MAP_TILE_CELLS
+    return full[r0:r0 + i1 - i0 + 1, c0:c0 + j1 - j0 + 1], complete
+
+
+async def _compute_tiles(tiles, bucket):
+    """Fetch every cell of the given tiles in bulk and compute their AQI grids.
+
+    Returns the grids by tile and whether all cells were fetched successfully.
+    """
+    cells = []
+    for tile in tiles:
+        lats, lons = _tile_axes(*tile)
+        lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+        cells.append((lat_grid.ravel(), lon_grid.ravel()))
+    lat_all = np.concatenate([lat for lat, _ in cells])
+    lon_all = np.concatenate([lon for _, lon in cells])
+
+    # Only cells on the globe are fetched; longitudes wrap around the antimeridian
+    valid = np.abs(lat_all) <= 90
+    fetch_lon = np.round((lon_all + 180) % 360 - 180, 4)
+    coords = list(zip(lat_all[valid].tolist(), fetch_lon[valid].tolist()))
+    responses = await fetch_upstream_many(AQ_API, MAP_AQ_PARAMS, coords, return_exceptions=True)
+
+    pm25, o3, no2 = (np.full(len(lat_all), np.nan) for _ in range(3))
+    failed = np.zeros(len(lat_all), dtype=bool)
+    valid_idx = np.flatnonzero(valid)
+    for i, js in zip(valid_idx, responses):
+        current = js.get("current") if isinstance(js, dict) else None
+        if current is None:
+            failed[i] = True
+            continue
+        pm25[i] = _value(current.get("pm2_5"))
+        o3[i] = _value(current.get("ozone"))
+        no2[i] = _value(current.get("nitrogen_dioxide"))
+
+    aqi = np.fmax(
+        np.fmax(aqi_from_pm25_array(pm25), aqi_from_o3_array(o3 * O3_UGM3_TO_PPB)),
+        aqi_from_no2_ppb_array(no2 * NO2_UGM3_TO_PPB),
+    )
+
+    size = MAP_TILE_CELLS * MAP_TILE_CELLS
+    expires_at = (bucket + 1) * UPSTREAM_REFRESH_SECONDS
+    grids = {}
+    for n, tile in enumerate(tiles):
+        rows = slice(n * size, (n + 1) * size)
+        grid = aqi[rows].reshape(MAP_TILE_CELLS, MAP_TILE_CELLS)
+        grids[tile] = grid
+        # Tiles with failed cells are recomputed on the next request
+        if not failed[rows].any():
+            map_tile_cache.set((*tile, bucket), grid, expires_at=expires_at, size=grid.nbytes)
+    return grids, not failed.any()
+
+
+def _value(v):
+    return np.nan if v is None else float(v)
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import time
+import os
+import shutil
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; prewarm then runs in every process
+    fcntl = None
+
+from cache import SingleFlight
+from map_grid import MAP_BASE_STEP, MAP_MAX_LEVEL, aqi_lattice, level_step
+from ml_service import UPSTREAM_REFRESH_SECONDS, upstream_bucket
+
+# Slippy-map (Web Mercator z/x/y) AQI raster tiles. Each tile is rendered once
+# per CAMS bucket from the map lattice at roughly TILE_CELLS_ACROSS cells per
+# tile, written to TILE_CACHE_DIR/<bucket>/<z>/<x>/<y>.png and served from
+# disk afterwards. The ETag only depends on bucket and tile address, so
+# revalidation never touches the renderer.
+TILE_SIZE = 256
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "12"))
+TILE_CELLS_ACROSS = 16
+TILE_ALPHA = 170
+# Pre-render zooms 0..TILE_PREWARM_ZOOM each bucket (-1 = off). A pass at
+# zoom 2 costs ~1.9k upstream coordinates per hour, so it is opt-in and runs
+# in one process per host (see prewarm_pyramid).
+TILE_PREWARM_ZOOM = int(os.getenv("TILE_PREWARM_ZOOM", "-1"))
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tile_cache"))
+
+# Same category colours as the map legend in the frontend
+AQI_COLOR_LIMITS = np.array([50, 100, 150, 200, 300])
+AQI_PALETTE = np.array([
+    [0x00, 0xE6, 0x76, TILE_ALPHA],
+    [0xFF, 0xEB, 0x3B, TILE_ALPHA],
+    [0xFF, 0x98, 0x00, TILE_ALPHA],
+    [0xF4, 0x43, 0x36, TILE_ALPHA],
+    [0x9C, 0x27, 0xB0, TILE_ALPHA],
+    [0x88, 0x0E, 0x4F, TILE_ALPHA],
+    [0x00, 0x00, 0x00, 0],  # no data
+], dtype=np.uint8)
+
+tile_flights = SingleFlight()
+_pruned_bucket = None
+
+
+def tile_etag(z, x, y, bucket):
+    return f'"aqi-{bucket}-{z}-{x}-{y}"'
+
+
+def tile_expires_at(bucket):
+    return (bucket + 1) * UPSTREAM_REFRESH_SECONDS
+
+
+def tile_path(z, x, y, bucket):
+    return os.path.join(TILE_CACHE_DIR, str(bucket), str(z), str(x), f"{y}.png")
+
+
+async def get_aqi_tile(z: int, x: int, y: int, bucket: int = None):
+    """PNG bytes for tile z/x/y of the current bucket, rendering it on first use.
+
+    Returns (png, complete); incomplete tiles (upstream failures left holes)
+    are neither persisted nor meant to be cached by clients.
+    """
+    bucket = upstream_bucket() if bucket is None else bucket
+    path = tile_path(z, x, y, bucket)
+    try:
+        with open(path, "rb") as f:
+            return f.read(), True
+    except FileNotFoundError:
+        pass
+    return await tile_flights.do((z, x, y, bucket), lambda: _render_and_store(z, x, y, bucket, path))
+
+
+async def _render_and_store(z, x, y, bucket, path):
+    aqi, complete = await render_tile_aqi(z, x, y)
+    png = encode_png(colorize(aqi))
+    # Tiles with holes from upstream failures are served but not persisted
+    if complete:
+        _prune_old_buckets(bucket)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+    return png, complete
+
+
+async def render_tile_aqi(z, x, y):
+    """Per-pixel AQI (TILE_SIZE x TILE_SIZE, NaN where unknown) for a tile, and completeness"""
+    n = 2 ** z
+    west, east = x / n * 360 - 180, (x + 1) / n * 360 - 180
+    span = east - west
+    level = min(max(math.ceil(math.log2(span / (TILE_CELLS_ACROSS * MAP_BASE_STEP))), 0), MAP_MAX_LEVEL)
+    step = level_step(level)
+
+    pixels = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = west + pixels * span
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixels) / n))))
+
+    rows = np.rint(lats / step).astype(int)
+    cols = np.rint(lons / step).astype(int)
+    i0, j0 = rows.min(), cols.min()
+    lattice, complete = await aqi_lattice(level, i0, rows.max(), j0, cols.max())
+    return lattice[np.ix_(rows - i0, cols - j0)], complete
+
+
+async def prewarm_pyramid(max_zoom: int = TILE_PREWARM_ZOOM):
+    """Render zoom levels 0..max_zoom whenever a new CAMS bucket starts.
+
+    Only the process holding the prewarm lock in TILE_CACHE_DIR renders;
+    the others retry each bucket, so the job moves on if the holder exits.
+    """
+    lock = None
+    while True:
+        bucket = upstream_bucket()
+        lock = lock or _acquire_prewarm_lock()
+        if lock is None:
+            await asyncio.sleep(max(tile_expires_at(bucket) - time.time(), 1))
+            continue
+        for z in range(max_zoom + 1):
+            for x in range(2 ** z):
+                for y in range(2 ** z):
+                    try:
+                        await get_aqi_tile(z, x, y, bucket)
+                    except Exception as e:
+                        print(f"Tile prewarm {z}/{x}/{y} failed: {e}")
+        await asyncio.sleep(max(tile_expires_at(bucket) - time.time(), 1))
+
+
+def _acquire_prewarm_lock():
+    """Open file holding the host-wide prewarm lock, or None if another process has it"""
+    os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+    f = open(os.path.join(TILE_CACHE_DIR, ".prewarm.lock"), "a")
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def colorize(aqi):
+    """RGBA pixels for an AQI array using the legend categories"""
+    category = np.searchsorted(AQI_COLOR_LIMITS, aqi, side="left")
+    category[np.isnan(aqi)] = len(AQI_PALETTE) - 1
+    return AQI_PALETTE[category]
+
+
+def encode_png(rgba):
+    """Minimal RGBA8 PNG encoder (no filtering)"""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _prune_old_buckets(bucket):
+    """Remove tile directories of earlier buckets once a newer one is written"""
+    global _pruned_bucket
+    if _pruned_bucket == bucket or not os.path.isdir(TILE_CACHE_DIR):
+        _pruned_bucket = bucket
+        return
+    for name in os.listdir(TILE_CACHE_DIR):
+        if name.isdigit() and int(name) < bucket:
+            shutil.rmtree(os.path.join(TILE_CACHE_DIR, name), ignore_errors=True)
+    _pruned_bucket = bucket
@@ -1,21 +1,34 @@
-import io
 import math
+import time
+import asyncio
+import functools
+import httpx
 import pandas as pd
-import requests as rq
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional
 import os
+import re
+import json
+import numpy as np
+
+from cache import SingleFlight, estimate_size, make_cache
+from workers import WorkerPool
 
 # Optional ML dependencies (only needed when models are enabled)
 try:
-    import numpy as np
     from joblib import load
     ML_LIBS_AVAILABLE = True
 except ImportError:
     ML_LIBS_AVAILABLE = False
-    np = None
     load = None
 
+# Optional fast JSON decoder for upstream responses
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Constants
 O3_UGM3_TO_PPB = 0.509
 NO2_UGM3_TO_PPB = 1.88
@@ -28,103 +41,459 @@ UA_HEADERS = {"User-Agent": "skyphoria-aircast/1.0"}
 # Check if running in production/deployment mode
 IS_DEPLOYMENT = os.getenv("EMERGENT_DEPLOYMENT", "false").lower() == "true"
 
-# Load ML models (optional for deployment)
-if IS_DEPLOYMENT or not ML_LIBS_AVAILABLE:
-    print("Running in deployment mode or ML libs not available - using CAMS forecast only")
-    MODELS_LOADED = False
-    pm_model, o3_model = None, None
-    pm_feats, o3_feats = [], []
-else:
+# ML models are loaded by load_models(), normally from a background task at
+# server startup; until then (or when disabled) forecasts use CAMS directly.
+MODEL_DIR = os.getenv("MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+# Inference backend: "lightgbm" (the fitted model) or "numpy" (tree_eval.NumpyForest,
+# identical predictions). The NumPy evaluator wins on small batches only, so
+# batches above MODEL_NUMPY_MAX_ROWS still go to LightGBM.
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "lightgbm").lower()
+MODEL_NUMPY_MAX_ROWS = int(os.getenv("MODEL_NUMPY_MAX_ROWS", "1024"))
+MODELS_LOADED = False
+MODELS_STATE = "pending"  # pending | loading | ready | disabled | failed
+pm_model, o3_model = None, None
+pm_feats, o3_feats = [], []
+pm_plan, o3_plan = [], []
+pm_predict, o3_predict = None, None
+
+def _model_predictor(model, name):
+    """predict(X) callable for a fitted model using the configured MODEL_BACKEND"""
+    if MODEL_BACKEND == "numpy":
+        try:
+            from tree_eval import NumpyForest
+            forest = NumpyForest(model.booster_)
+        except Exception as e:
+            print(f"NumPy inference backend unavailable for {name}, using LightGBM: {e}")
+            return model.predict
+        return lambda X: forest.predict(X) if len(X) <= MODEL_NUMPY_MAX_ROWS else model.predict(X)
+    return model.predict
+
+def load_models():
+    """Load both model bundles (blocking) and compile their feature plans.
+
+    Bundles are opened from their paths with mmap_mode so numpy payloads are
+    mapped rather than copied. Returns True once models are ready.
+    """
+    global MODELS_LOADED, MODELS_STATE, pm_model, o3_model, pm_feats, o3_feats, pm_plan, o3_plan
+    global pm_predict, o3_predict
+    if MODELS_LOADED:
+        return True
+    if IS_DEPLOYMENT or not ML_LIBS_AVAILABLE:
+        print("Running in deployment mode or ML libs not available - using CAMS forecast only")
+        MODELS_STATE = "disabled"
+        return False
+    
+    MODELS_STATE = "loading"
+    started = time.perf_counter()
     try:
-        with open("model_pm25.joblib", "rb") as f:
-            pm_bundle = load(io.BytesIO(f.read()))
-            pm_model = pm_bundle["model"]
-            pm_feats = pm_bundle["features"]
-        
-        with open("model_o3.joblib", "rb") as f:
-            o3_bundle = load(io.BytesIO(f.read()))
-            o3_model = o3_bundle["model"]
-            o3_feats = o3_bundle["features"]
-        
-        MODELS_LOADED = True
-        print("ML models loaded successfully")
+        pm_bundle = load(os.path.join(MODEL_DIR, "model_pm25.joblib"), mmap_mode="r")
+        o3_bundle = load(os.path.join(MODEL_DIR, "model_o3.joblib"), mmap_mode="r")
+        pm_plan = compile_feature_plan(pm_bundle["features"])
+        o3_plan = compile_feature_plan(o3_bundle["features"])
+        pm_model, pm_feats = pm_bundle["model"], pm_bundle["features"]
+        o3_model, o3_feats = o3_bundle["model"], o3_bundle["features"]
+        pm_predict = _model_predictor(pm_model, "pm25")
+        o3_predict = _model_predictor(o3_model, "o3")
     except Exception as e:
         print(f"Warning: Could not load ML models: {e}")
-        MODELS_LOADED = False
-        pm_model, o3_model = None, None
-        pm_feats, o3_feats = [], []
+        MODELS_STATE = "failed"
+        return False
+    
+    # Flip the flag last so requests never see a half-loaded state
+    MODELS_LOADED = True
+    MODELS_STATE = "ready"
+    print(f"ML models loaded successfully in {time.perf_counter() - started:.2f}s")
+    return True
+
+async def load_models_in_background():
+    """load_models in a worker thread so the server keeps serving CAMS meanwhile"""
+    return await asyncio.to_thread(load_models)
+
+# Upstream HTTP settings (tunable per deployment)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "20"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_PER_HOST_LIMIT = int(os.getenv("UPSTREAM_PER_HOST_LIMIT", "32"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_loop = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
 
 # HTTP helper
-def get_json(url, params=None, timeout=60):
-    r = rq.get(url, params=params, timeout=timeout, headers=UA_HEADERS)
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled keep-alive client, bound to the running event loop"""
+    global _http_client, _http_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            headers=UA_HEADERS,
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            ),
+        )
+        _http_loop = loop
+        _host_limits.clear()
+    return _http_client
+
+async def close_http_client():
+    global _http_client, _http_loop
+    if _http_client is not None and _http_loop is asyncio.get_running_loop():
+        await _http_client.aclose()
+    _http_client, _http_loop = None, None
+    _host_limits.clear()
+
+async def get_json(url, params=None, timeout=None):
+    client = get_http_client()
+    host = httpx.URL(url).host
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(UPSTREAM_PER_HOST_LIMIT)
+    async with limit:
+        r = await client.get(url, params=params, timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout)
     r.raise_for_status()
-    return r.json()
+    return decode_json(r.content)
+
+# Upstream response cache. CAMS and Open-Meteo models update hourly on a
+# ~10-40 km grid, so requests snapped to the same grid cell within the same
+# hour share one entry.
+UPSTREAM_CACHE_MB = int(os.getenv("UPSTREAM_CACHE_MB", "256"))
+UPSTREAM_REFRESH_SECONDS = int(os.getenv("UPSTREAM_REFRESH_SECONDS", "3600"))
+UPSTREAM_GRID_DEG = {OPEN_METEO_FC: 0.1, AQ_API: 0.1, OPEN_METEO_HIST: 0.25}
+UPSTREAM_BATCH_SIZE = int(os.getenv("UPSTREAM_BATCH_SIZE", "100"))
+
+upstream_cache = make_cache("upstream", UPSTREAM_CACHE_MB * 1024 * 1024)
+upstream_flights = SingleFlight()
+
+def snap_coord(value, step):
+    return round(round(float(value) / step) * step, 4)
+
+def upstream_bucket(now=None):
+    now = time.time() if now is None else now
+    return int(now // UPSTREAM_REFRESH_SECONDS)
+
+def upstream_key(url, lat, lon, query, bucket):
+    """Cache key: endpoint, snapped lat/lon, remaining query (variables, range) and time bucket"""
+    step = UPSTREAM_GRID_DEG.get(url, 0.1)
+    return (url, snap_coord(lat, step), snap_coord(lon, step), query, bucket)
+
+async def fetch_upstream(url, params, parse=None):
+    """Fetch a single-location upstream response through the spatial TTL cache"""
+    query = {k: v for k, v in params.items() if k not in ("latitude", "longitude")}
+    (value,) = await fetch_upstream_many(url, query, [(params["latitude"], params["longitude"])], parse)
+    return value
+
+async def fetch_upstream_many(url, params, coords, parse=None, return_exceptions=False):
+    """Fetch one upstream response per (lat, lon) through the spatial TTL cache.
+
+    Cache misses are requested with Open-Meteo's multi-coordinate syntax, up to
+    UPSTREAM_BATCH_SIZE grid cells per request, always for the grid-cell centre
+    so the cached value is valid for every caller snapped to that cell.
+    Concurrent misses for the same key share a single in-flight request and
+    receive the same parsed object, so cached and shared values must be treated
+    as read-only. With ``return_exceptions`` failed locations hold the exception
+    instead of raising.
+    """
+    bucket = upstream_bucket()
+    query = tuple(sorted((k, str(v)) for k, v in params.items()))
+    keys = [upstream_key(url, lat, lon, query, bucket) for lat, lon in coords]
+    
+    values, tasks, misses = {}, {}, []
+    for key in dict.fromkeys(keys):
+        value = upstream_cache.get(key)
+        if value is not None:
+            values[key] = value
+        elif upstream_flights.running(key):
+            tasks[key] = upstream_flights.join(key)
+        else:
+            misses.append(key)
+    
+    # One request per chunk of missing cells; each cell is registered with the
+    # single-flight layer so other callers can join it
+    for i in range(0, len(misses), UPSTREAM_BATCH_SIZE):
+        chunk = misses[i:i + UPSTREAM_BATCH_SIZE]
+        request = asyncio.ensure_future(_load_cells(url, params, chunk, parse, bucket))
+        for j, key in enumerate(chunk):
+            tasks[key] = upstream_flights.start(key, functools.partial(_pick, request, j))
+    
+    if tasks:
+        results = await asyncio.gather(*(asyncio.shield(t) for t in tasks.values()), return_exceptions=True)
+        values.update(zip(tasks, results))
+    
+    out = [values[key] for key in keys]
+    if not return_exceptions:
+        for value in out:
+            if isinstance(value, BaseException):
+                raise value
+    return out
+
+async def _load_cells(url, params, keys, parse, bucket):
+    js = await get_json(url, {
+        **params,
+        "latitude": ",".join(str(key[1]) for key in keys),
+        "longitude": ",".join(str(key[2]) for key in keys),
+    })
+    payloads = js if isinstance(js, list) else [js]
+    if len(payloads) != len(keys):
+        raise ValueError(f"Expected {len(keys)} locations from upstream, got {len(payloads)}")
+    values = []
+    for key, payload in zip(keys, payloads):
+        value = parse(payload) if parse is not None else payload
+        if not (isinstance(value, pd.DataFrame) and value.empty):
+            upstream_cache.set(key, value, expires_at=(bucket + 1) * UPSTREAM_REFRESH_SECONDS)
+        values.append(value)
+    return values
+
+async def _pick(request, i):
+    return (await request)[i]
+
+def cache_stats():
+    return {
+        "upstream": {**upstream_cache.stats(), "coalesced": upstream_flights.shared},
+        "history": history_buffers.stats(),
+    }
+
+# Response parsing
+def decode_json(body: bytes):
+    return orjson.loads(body) if ORJSON_AVAILABLE else json.loads(body)
+
+def parse_hourly(js):
+    """Hourly block as a float DataFrame on a UTC DatetimeIndex named "time".
+
+    Open-Meteo returns a regular, ascending hourly grid, so the index is built
+    from the first timestamp and the length; only when the last timestamp does
+    not match that grid are all time strings parsed and sorted. Values stay
+    float64 so API responses echo upstream numbers exactly; the model inputs
+    are narrowed to float32 by the feature plans.
+    """
+    hourly = js.get("hourly")
+    if not hourly or "time" not in hourly:
+        return pd.DataFrame()
+    times = hourly["time"]
+    columns = {
+        name: np.array(values, dtype=np.float64)
+        for name, values in hourly.items() if name != "time"
+    }
+    if times:
+        first = pd.Timestamp(times[0], tz="UTC")
+        if pd.Timestamp(times[-1], tz="UTC") == first + pd.Timedelta(hours=len(times) - 1):
+            index = pd.date_range(first, periods=len(times), freq="h", name="time")
+            return pd.DataFrame(columns, index=index)
+    return _parse_hourly_strings(hourly)
+
+def _parse_hourly_strings(hourly):
+    """Generic path: parse every timestamp string and sort"""
+    df = pd.DataFrame(hourly)
+    df["time"] = pd.to_datetime(df["time"], utc=True)
+    return df.set_index("time").sort_index().astype(np.float64)
 
 # Data fetchers
-def fetch_openmeteo_forecast(hours_ahead, lat, lon, hourly_vars):
+METEO_VARS = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "dew_point_2m",
+    "wind_speed_10m",
+    "wind_direction_10m",
+    "surface_pressure",
+    "precipitation",
+    "shortwave_radiation",
+]
+
+async def fetch_openmeteo_forecast(hours_ahead, lat, lon, hourly_vars):
+    (df,) = await fetch_openmeteo_forecast_many(hours_ahead, [(lat, lon)], hourly_vars, return_exceptions=False)
+    return df
+
+async def fetch_openmeteo_forecast_many(hours_ahead, coords, hourly_vars, return_exceptions=True):
     params = {
-        "latitude": lat,
-        "longitude": lon,
         "hourly": ",".join(hourly_vars),
         "forecast_days": math.ceil(hours_ahead / 24),
         "timezone": "UTC",
     }
-    js = get_json(OPEN_METEO_FC, params)
-    if "hourly" not in js:
-        return pd.DataFrame()
-    df = pd.DataFrame(js["hourly"])
-    df["time"] = pd.to_datetime(df["time"], utc=True)
-    return df.set_index("time").sort_index()
+    return await fetch_upstream_many(OPEN_METEO_FC, params, coords, parse_hourly, return_exceptions)
+
+# Long history windows are split into chunk_days requests fetched
+# concurrently; failed coordinates are retried with exponential backoff.
+HISTORY_CHUNK_CONCURRENCY = int(os.getenv("HISTORY_CHUNK_CONCURRENCY", "4"))
+HISTORY_CHUNK_RETRIES = int(os.getenv("HISTORY_CHUNK_RETRIES", "3"))
+HISTORY_RETRY_BACKOFF = float(os.getenv("HISTORY_RETRY_BACKOFF", "0.5"))
+
+async def fetch_openmeteo_aq_history(start, end, lat, lon, chunk_days=90):
+    (hist,) = await fetch_openmeteo_aq_history_many(start, end, [(lat, lon)], chunk_days)
+    return hist
 
-def fetch_openmeteo_aq_history(start, end, lat, lon, chunk_days=90):
-    rows_pm, rows_o3, rows_no2 = [], [], []
+async def fetch_openmeteo_aq_history_many(start, end, coords, chunk_days=90):
+    hists, failures = await fetch_openmeteo_aq_history_chunked(start, end, coords, chunk_days)
+    for failure in failures:
+        print(f"AQ history chunk {failure['start_date']}..{failure['end_date']} failed "
+              f"for ({failure['lat']}, {failure['lon']}): {failure['error']}")
+    return hists
+
+async def fetch_openmeteo_aq_history_chunked(start, end, coords, chunk_days=90,
+                                             concurrency=HISTORY_CHUNK_CONCURRENCY, retries=HISTORY_CHUNK_RETRIES):
+    """AQ history per location plus a report of chunks that still failed after retries.
+
+    Returns (hists, failures): hists as from fetch_openmeteo_aq_history_many,
+    failures as dicts with lat, lon, start_date, end_date and error.
+    """
+    chunks = []
     cur = start
     while cur < end:
         nxt = min(end, cur + timedelta(days=chunk_days))
-        params = {
-            "latitude": lat,
-            "longitude": lon,
+        chunks.append({
             "hourly": "pm2_5,ozone,nitrogen_dioxide",
             "start_date": cur.date().isoformat(),
             "end_date": nxt.date().isoformat(),
             "timezone": "UTC",
-        }
-        try:
-            js = get_json(AQ_API, params)
-            if "hourly" in js and "time" in js["hourly"]:
-                hh = pd.DataFrame(js["hourly"])
-                hh["time"] = pd.to_datetime(hh["time"], utc=True)
-                hh = hh.set_index("time").sort_index()
-                if "pm2_5" in hh:
-                    rows_pm.append(hh[["pm2_5"]].rename(columns={"pm2_5": "pm25"}))
-                if "ozone" in hh:
-                    rows_o3.append(hh[["ozone"]].rename(columns={"ozone": "o3"}))
-                if "nitrogen_dioxide" in hh:
-                    rows_no2.append(hh[["nitrogen_dioxide"]].rename(columns={"nitrogen_dioxide": "no2"}))
-        except:
-            pass
+        })
         cur = nxt
     
-    return {
-        "pm25": pd.concat(rows_pm).sort_index() if rows_pm else pd.DataFrame(columns=["pm25"]),
-        "o3": pd.concat(rows_o3).sort_index() if rows_o3 else pd.DataFrame(columns=["o3"]),
-        "no2": pd.concat(rows_no2).sort_index() if rows_no2 else pd.DataFrame(columns=["no2"]),
-    }
+    limit = asyncio.Semaphore(concurrency)
+    fetched = await asyncio.gather(*(_fetch_history_chunk(params, coords, limit, retries) for params in chunks))
+    
+    rows = [([], [], []) for _ in coords]
+    failures = []
+    # Merge in chunk order
+    for params, frames in zip(chunks, fetched):
+        for (lat, lon), (rows_pm, rows_o3, rows_no2), hh in zip(coords, rows, frames):
+            if isinstance(hh, Exception):
+                failures.append({
+                    "lat": lat, "lon": lon,
+                    "start_date": params["start_date"], "end_date": params["end_date"],
+                    "error": str(hh) or type(hh).__name__,
+                })
+                continue
+            if hh.empty:
+                continue
+            if "pm2_5" in hh:
+                rows_pm.append(hh[["pm2_5"]].rename(columns={"pm2_5": "pm25"}))
+            if "ozone" in hh:
+                rows_o3.append(hh[["ozone"]].rename(columns={"ozone": "o3"}))
+            if "nitrogen_dioxide" in hh:
+                rows_no2.append(hh[["nitrogen_dioxide"]].rename(columns={"nitrogen_dioxide": "no2"}))
+    
+    def merge(parts, column):
+        if not parts:
+            return pd.DataFrame(columns=[column])
+        # Consecutive chunks share their boundary day; the later chunk wins
+        df = pd.concat(parts)
+        return df[~df.index.duplicated(keep="last")].sort_index()
+    
+    hists = [
+        {"pm25": merge(rows_pm, "pm25"), "o3": merge(rows_o3, "o3"), "no2": merge(rows_no2, "no2")}
+        for rows_pm, rows_o3, rows_no2 in rows
+    ]
+    return hists, failures
+
+async def _fetch_history_chunk(params, coords, limit, retries):
+    """One history chunk for every location, retrying failed locations"""
+    async with limit:
+        results = [None] * len(coords)
+        pending = list(range(len(coords)))
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(HISTORY_RETRY_BACKOFF * 2 ** (attempt - 1))
+            fetched = await fetch_upstream_many(
+                AQ_API, params, [coords[i] for i in pending], parse_hourly, return_exceptions=True
+            )
+            for i, value in zip(pending, fetched):
+                results[i] = value
+            pending = [i for i in pending if isinstance(results[i], Exception) and _retryable(results[i])]
+            if not pending:
+                break
+        return results
+
+def _retryable(exc):
+    # Client errors other than rate limiting will not succeed on retry
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+# Rolling per-cell history for forecasts. Each buffer remembers the hour it
+# was fetched at; hours from then on were still CAMS forecasts and may have
+# been revised, so a later request refetches only that tail.
+HISTORY_BUFFER_MB = int(os.getenv("HISTORY_BUFFER_MB", "64"))
+HISTORY_BUFFER_HOURS = int(os.getenv("HISTORY_BUFFER_HOURS", str(14 * 24)))
+HISTORY_BUFFER_TTL = int(os.getenv("HISTORY_BUFFER_TTL", str(24 * 3600)))
+AQ_HISTORY_VARS = {"pm2_5": "pm25", "ozone": "o3", "nitrogen_dioxide": "no2"}
 
-def fetch_openmeteo_aq_forecast(hours_ahead, lat, lon):
+history_buffers = make_cache("history", HISTORY_BUFFER_MB * 1024 * 1024)
+
+async def fetch_recent_aq_history_many(start, end, coords):
+    """Same frames as fetch_openmeteo_aq_history_many for a recent window, served
+    from rolling per-cell buffers that only fetch hours not yet settled."""
+    window_start = pd.Timestamp(start.date(), tz="UTC")
+    window_end = pd.Timestamp(end.date(), tz="UTC") + pd.Timedelta(hours=23)
+    now_hour = pd.Timestamp(datetime.now(timezone.utc)).floor("h")
+    bucket = upstream_bucket()
+    step = UPSTREAM_GRID_DEG[AQ_API]
+    cells = [(snap_coord(lat, step), snap_coord(lon, step)) for lat, lon in coords]
+    
+    # Buffers keep at least HISTORY_BUFFER_HOURS, or the whole window if longer
+    keep_from = min(window_start, now_hour - pd.Timedelta(hours=HISTORY_BUFFER_HOURS))
+    
+    buffers, full, tails = {}, [], {}
+    for cell in dict.fromkeys(cells):
+        entry = history_buffers.get(cell)
+        if entry is None or entry[0].index.min() > window_start:
+            full.append(cell)
+            continue
+        buffers[cell] = entry[0]
+        if entry[2] != bucket:
+            tails.setdefault(entry[1], []).append(cell)
+    
+    if full:
+        fetched = await fetch_openmeteo_aq_history_many(start, end, full)
+        for cell, hist in zip(full, fetched):
+            frame = pd.concat([hist["pm25"], hist["o3"], hist["no2"]], axis=1)
+            if not frame.empty:
+                buffers[cell] = _store_history(cell, frame, keep_from, now_hour, bucket)
+    
+    for tail_start, tail_cells in tails.items():
+        params = {
+            "hourly": ",".join(AQ_HISTORY_VARS),
+            "start_hour": tail_start.strftime("%Y-%m-%dT%H:%M"),
+            "end_hour": window_end.strftime("%Y-%m-%dT%H:%M"),
+            "timezone": "UTC",
+        }
+        fetched = await fetch_upstream_many(AQ_API, params, tail_cells, parse_hourly, return_exceptions=True)
+        for cell, tail in zip(tail_cells, fetched):
+            # On failure keep serving the existing buffer until the next bucket:
+            # re-stored under this bucket with its old fetched hour, so the
+            # tail is retried (from the same hour) once per bucket, not per request
+            if isinstance(tail, Exception) or tail.empty:
+                _store_history(cell, buffers[cell], keep_from, tail_start, bucket)
+                continue
+            old = buffers[cell]
+            tail = tail.rename(columns=AQ_HISTORY_VARS).reindex(columns=old.columns)
+            frame = pd.concat([old[old.index < tail.index.min()], tail])
+            buffers[cell] = _store_history(cell, frame, keep_from, now_hour, bucket)
+    
+    results = []
+    for cell in cells:
+        frame = buffers.get(cell)
+        frame = frame.loc[window_start:window_end] if frame is not None else pd.DataFrame(columns=["pm25", "o3", "no2"])
+        results.append({name: frame[[name]] for name in ["pm25", "o3", "no2"]})
+    return results
+
+def _store_history(cell, frame, keep_from, fetched_hour, bucket):
+    frame = frame[frame.index >= keep_from]
+    history_buffers.set(cell, (frame, fetched_hour, bucket), expires_at=time.time() + HISTORY_BUFFER_TTL, size=estimate_size(frame))
+    return frame
+
+async def fetch_openmeteo_aq_forecast(hours_ahead, lat, lon):
+    (df,) = await fetch_openmeteo_aq_forecast_many(hours_ahead, [(lat, lon)], return_exceptions=False)
+    return df
+
+async def fetch_openmeteo_aq_forecast_many(hours_ahead, coords, return_exceptions=True):
     params = {
-        "latitude": lat,
-        "longitude": lon,
         "hourly": "pm2_5,ozone,nitrogen_dioxide,pm10",
         "forecast_days": math.ceil(hours_ahead / 24),
         "timezone": "UTC",
     }
-    js = get_json(AQ_API, params)
-    if "hourly" not in js:
-        return pd.DataFrame()
-    h = pd.DataFrame(js["hourly"])
-    h["time"] = pd.to_datetime(h["time"], utc=True)
-    return h.set_index("time").sort_index()
+    return await fetch_upstream_many(AQ_API, params, coords, parse_hourly, return_exceptions)
 
 # Feature engineering (only used when ML models are loaded)
 def make_hourly_features(df_pollutant, met):
@@ -155,113 +524,342 @@ def make_hourly_features(df_pollutant, met):
     df["cos_doy"] = np.cos(2 * np.pi * df["doy"] / 365.25)
     return df
 
+# Feature plans: each model's feature list compiled once into per-column
+# operations, so a request computes only the columns the model uses and
+# writes them straight into a float32 matrix in model column order.
+CALENDAR_FEATURES = {"hour", "dow", "doy", "sin_doy", "cos_doy"}
+FEATURE_FFILL_LIMIT = 2
+
+def compile_feature_plan(feats):
+    """List of (op, source, param) per model column, in column order"""
+    plan = []
+    for name in feats:
+        lag = re.fullmatch(r"(\w+)_lag(\d+)h", name)
+        roll = re.fullmatch(r"(\w+)_roll(\d+)_(mean|max)", name)
+        if name in CALENDAR_FEATURES or name in ("u10", "v10"):
+            plan.append((name, None, None))
+        elif lag:
+            plan.append(("lag", lag[1], int(lag[2])))
+        elif roll:
+            plan.append((roll[3], roll[1], int(roll[2])))
+        else:
+            plan.append(("met", name, None))
+    return plan
+
+def plan_targets(plan):
+    return list(dict.fromkeys(source for op, source, _ in plan if op in ("lag", "mean", "max")))
+
+def build_planned_features(plans, met, pollutants, outs=None):
+    """Fill one float32 matrix per plan for the meteo hours of ``met``.
+
+    ``pollutants`` maps target name to its single-column history frame.
+    ``outs`` are optional preallocated (len(met), len(plan)) arrays, e.g. row
+    slices of a stacked batch matrix. Values match make_hourly_features
+    followed by [feats].ffill(limit=2), cast to float32.
+    """
+    index = met.index
+    n = len(index)
+    if outs is None:
+        outs = [np.empty((n, len(plan)), dtype=np.float32) for plan in plans]
+    
+    met_values = met.to_numpy(dtype=float)
+    met_columns = {name: j for j, name in enumerate(met.columns)}
+    
+    # Left-join each target onto the meteo hours
+    targets = list(dict.fromkeys(t for plan in plans for t in plan_targets(plan)))
+    aligned = np.full((n, len(targets)), np.nan)
+    for j, t in enumerate(targets):
+        history = pollutants[t]
+        history = history[~history.index.duplicated(keep="last")]
+        if len(history):
+            rows = history.index.get_indexer(index)
+            found = rows >= 0
+            aligned[found, j] = history[t].to_numpy(dtype=float)[rows[found]]
+    position = {t: j for j, t in enumerate(targets)}
+    calendar = index.tz_convert("UTC")
+    computed = {}
+    
+    def column(op, source, param):
+        key = (op, source, param)
+        if key in computed:
+            return computed[key]
+        if op == "met":
+            values = met_values[:, met_columns[source]]
+        elif op in ("u10", "v10"):
+            rad = np.deg2rad(met_values[:, met_columns["wind_direction_10m"]])
+            trig = np.cos if op == "u10" else np.sin
+            values = met_values[:, met_columns["wind_speed_10m"]] * trig(rad)
+        elif op == "lag":
+            values = np.full(n, np.nan)
+            if param < n:
+                values[param:] = aligned[:n - param, position[source]]
+        elif op in ("mean", "max"):
+            # Time-based pandas rolling keeps results identical to the reference
+            if ("roll", param) not in computed:
+                rolling = pd.DataFrame(aligned, index=index).rolling(f"{param}h", min_periods=3)
+                computed[("roll", param)] = (rolling.mean().to_numpy(), rolling.max().to_numpy())
+            means, maxes = computed[("roll", param)]
+            values = (means if op == "mean" else maxes)[:, position[source]]
+        elif op == "hour":
+            values = calendar.hour.to_numpy()
+        elif op == "dow":
+            values = calendar.dayofweek.to_numpy()
+        else:
+            doy = calendar.dayofyear.to_numpy()
+            values = {
+                "doy": doy,
+                "sin_doy": np.sin(2 * np.pi * doy / 365.25),
+                "cos_doy": np.cos(2 * np.pi * doy / 365.25),
+            }[op]
+        computed[key] = values
+        return values
+    
+    for plan, out in zip(plans, outs):
+        for j, step in enumerate(plan):
+            out[:, j] = column(*step)
+        _ffill_rows(out, FEATURE_FFILL_LIMIT)
+    return outs
+
+def _ffill_rows(matrix, limit):
+    """In-place forward fill down each column, at most ``limit`` rows past a value"""
+    if not len(matrix):
+        return
+    valid = ~np.isnan(matrix)
+    rows = np.arange(len(matrix))[:, None]
+    last = np.where(valid, rows, -1)
+    np.maximum.accumulate(last, axis=0, out=last)
+    fill = ~valid & (last >= 0) & (rows - last <= limit)
+    matrix[fill] = matrix[last[fill], np.nonzero(fill)[1]]
+
+# AQI breakpoint tables: (c_low, c_high, aqi_low, aqi_high). Concentrations
+# outside every band (above the table or in the gaps between bands) map to
+# the table's cap value.
+PM25_BREAKPOINTS = [
+    (0, 12.0, 0, 50),
+    (12.1, 35.4, 51, 100),
+    (35.5, 55.4, 101, 150),
+    (55.5, 150.4, 151, 200),
+    (150.5, 250.4, 201, 300),
+    (250.5, 350.4, 301, 400),
+    (350.5, 500.4, 401, 500),
+]
+O3_BREAKPOINTS = [(0, 54, 0, 50), (55, 70, 51, 100), (71, 85, 101, 150), (86, 105, 151, 200), (106, 200, 201, 300)]
+NO2_BREAKPOINTS = [(0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150), (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 400)]
+
+def _breakpoint_arrays(brks):
+    return tuple(np.array(col, dtype=float) for col in zip(*brks))
+
+PM25_TABLE = _breakpoint_arrays(PM25_BREAKPOINTS)
+O3_TABLE = _breakpoint_arrays(O3_BREAKPOINTS)
+NO2_TABLE = _breakpoint_arrays(NO2_BREAKPOINTS)
+
 # AQI conversion functions
-def aqi_from_pm25(pm):
-    brks = [
-        (0, 12.0, 0, 50),
-        (12.1, 35.4, 51, 100),
-        (35.5, 55.4, 101, 150),
-        (55.5, 150.4, 151, 200),
-        (150.5, 250.4, 201, 300),
-        (250.5, 350.4, 301, 400),
-        (350.5, 500.4, 401, 500),
-    ]
-    if pd.isna(pm) or pm is None:
+def _aqi_scalar(value, brks, cap):
+    if pd.isna(value) or value is None:
         return float('nan')
     for c_low, c_high, a_low, a_high in brks:
-        if c_low <= pm <= c_high:
-            return (a_high - a_low) / (c_high - c_low) * (pm - c_low) + a_low
-    return 500.0
+        if c_low <= value <= c_high:
+            return (a_high - a_low) / (c_high - c_low) * (value - c_low) + a_low
+    return cap
+
+def aqi_from_pm25(pm):
+    return _aqi_scalar(pm, PM25_BREAKPOINTS, 500.0)
 
 def aqi_from_o3(o3_ppb):
-    brks = [(0, 54, 0, 50), (55, 70, 51, 100), (71, 85, 101, 150), (86, 105, 151, 200), (106, 200, 201, 300)]
-    if pd.isna(o3_ppb) or o3_ppb is None:
-        return float('nan')
-    for c_low, c_high, a_low, a_high in brks:
-        if c_low <= o3_ppb <= c_high:
-            return (a_high - a_low) / (c_high - c_low) * (o3_ppb - c_low) + a_low
-    return 300.0
+    return _aqi_scalar(o3_ppb, O3_BREAKPOINTS, 300.0)
 
 def aqi_from_no2_ppb(no2_ppb):
-    brks = [(0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150), (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 400)]
-    if pd.isna(no2_ppb) or no2_ppb is None:
-        return float('nan')
-    for c_low, c_high, a_low, a_high in brks:
-        if c_low <= no2_ppb <= c_high:
-            return (a_high - a_low) / (c_high - c_low) * (no2_ppb - c_low) + a_low
-    return 500.0
+    return _aqi_scalar(no2_ppb, NO2_BREAKPOINTS, 500.0)
+
+# Vectorized AQI conversion (same breakpoint semantics as the scalar versions)
+def _aqi_array(values, table, cap):
+    x = np.asarray(values, dtype=float)
+    c_low, c_high, a_low, a_high = table
+    # Candidate band: the last one whose lower bound is <= x
+    i = np.searchsorted(c_low, x, side="right") - 1
+    j = np.clip(i, 0, len(c_low) - 1)
+    in_band = (i >= 0) & (x <= c_high[j])
+    with np.errstate(invalid="ignore"):
+        aqi = (a_high[j] - a_low[j]) / (c_high[j] - c_low[j]) * (x - c_low[j]) + a_low[j]
+    out = np.where(np.isnan(x), np.nan, np.where(in_band, aqi, cap))
+    if isinstance(values, pd.Series):
+        return pd.Series(out, index=values.index)
+    return out
+
+def aqi_from_pm25_array(pm):
+    return _aqi_array(pm, PM25_TABLE, 500.0)
+
+def aqi_from_o3_array(o3_ppb):
+    return _aqi_array(o3_ppb, O3_TABLE, 300.0)
+
+def aqi_from_no2_ppb_array(no2_ppb):
+    return _aqi_array(no2_ppb, NO2_TABLE, 500.0)
+
+# Forecast assembly
+def forecast_frame(index, pm25, o3_ppb, no2_ppb):
+    """Columnar forecast: concentrations, per-pollutant AQI, overall AQI and dominant pollutant"""
+    pm25 = np.asarray(pm25, dtype=float)
+    o3_ppb = np.asarray(o3_ppb, dtype=float)
+    no2_ppb = np.asarray(no2_ppb, dtype=float)
+    aqi_pm = aqi_from_pm25_array(pm25)
+    aqi_o3 = aqi_from_o3_array(o3_ppb)
+    aqi_no2 = aqi_from_no2_ppb_array(no2_ppb)
+    dominant = np.select(
+        [(aqi_o3 > aqi_pm) & (aqi_o3 >= aqi_no2), (aqi_no2 > aqi_pm) & (aqi_no2 > aqi_o3)],
+        ["O3", "NO2"],
+        "PM2.5",
+    )
+    return pd.DataFrame({
+        "pm25": pm25,
+        "o3_ppb": o3_ppb,
+        "no2_ppb": no2_ppb,
+        "aqi_pm25": aqi_pm,
+        "aqi_o3": aqi_o3,
+        "aqi_no2": aqi_no2,
+        # Overall AQI ignores pollutants without data
+        "aqi": np.fmax(np.fmax(aqi_pm, aqi_o3), aqi_no2),
+        "dominant_pollutant": dominant,
+    }, index=index)
+
+def forecast_records(frame):
+    """Materialize a forecast frame as JSON-ready records in a single pass"""
+    def ints(col, missing):
+        values = frame[col].to_numpy()
+        return np.where(np.isnan(values), missing, values).astype(np.int64).tolist()
+
+    def floats(col):
+        return np.nan_to_num(frame[col].to_numpy(), nan=0.0).tolist()
+
+    return [
+        {
+            "timestamp": ts,
+            "aqi": aqi,
+            "pm25": pm25,
+            "o3_ppb": o3_ppb,
+            "no2_ppb": no2_ppb,
+            "aqi_pm25": aqi_pm,
+            "aqi_o3": aqi_o3,
+            "aqi_no2": aqi_no2,
+            "dominant_pollutant": dominant,
+        }
+        for ts, aqi, pm25, o3_ppb, no2_ppb, aqi_pm, aqi_o3, aqi_no2, dominant in zip(
+            [t.isoformat() for t in frame.index],
+            ints("aqi", 50),
+            floats("pm25"),
+            floats("o3_ppb"),
+            floats("no2_ppb"),
+            ints("aqi_pm25", 0),
+            ints("aqi_o3", 0),
+            ints("aqi_no2", 0),
+            frame["dominant_pollutant"].tolist(),
+        )
+    ]
 
 # Main prediction function
-def get_air_quality_prediction(lat: float, lon: float, hours: int = 72, hist_hours: int = 72):
+# Prediction work runs on a bounded thread pool so the event loop keeps
+# serving health checks and cached responses under forecast load
+PREDICTION_WORKERS = int(os.getenv("PREDICTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+PREDICTION_QUEUE_DEPTH = int(os.getenv("PREDICTION_QUEUE_DEPTH", "8"))
+prediction_pool = WorkerPool("prediction", PREDICTION_WORKERS, PREDICTION_QUEUE_DEPTH)
+
+async def get_air_quality_prediction(lat: float, lon: float, hours: int = 72, hist_hours: int = 72):
     """Main function to get air quality predictions (ML-based when available, CAMS fallback)"""
     
     # If ML models not available, use CAMS forecast directly
     if not MODELS_LOADED:
         print("Using CAMS forecast (ML models not available)")
-        return get_cams_forecast_fallback(lat, lon, hours)
+        return await get_cams_forecast_fallback(lat, lon, hours)
+    
+    (result,) = await get_air_quality_predictions([(lat, lon)], hours, hist_hours)
+    return result
+
+async def get_air_quality_predictions(locations, hours: int = 72, hist_hours: int = 72):
+    """Predictions for many (lat, lon) locations with a single predict call per model.
+
+    Upstream data for every location is fetched with multi-coordinate requests
+    and the per-location feature matrices are stacked before inference. Returns
+    one result per location, in order, shaped like get_air_quality_prediction.
+    """
+    if not MODELS_LOADED:
+        return await get_cams_forecast_fallbacks(locations, hours)
+    
+    now = datetime.now(timezone.utc)
+    start_hist = now - timedelta(hours=hist_hours)
     
     try:
-        HOURLY_VARS = [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "dew_point_2m",
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "surface_pressure",
-            "precipitation",
-            "shortwave_radiation",
-        ]
-        
-        now = datetime.now(timezone.utc)
-        start_hist = now - timedelta(hours=hist_hours)
-        
-        # Fetch CAMS air quality history
-        hist_aq = fetch_openmeteo_aq_history(start_hist, now, lat, lon, chunk_days=90)
-        pm25_hist = hist_aq["pm25"]
-        o3_hist = hist_aq["o3"]
-        
-        # Fetch meteorology forecast
-        met_fc = fetch_openmeteo_forecast(hours, lat, lon, HOURLY_VARS)
-        
-        # Fetch CAMS air quality forecast
-        aq_fc = fetch_openmeteo_aq_forecast(hours, lat, lon)
-        
-        # Build features for ML models
-        pm_ds_rt = make_hourly_features(pm25_hist, met_fc)
-        o3_ds_rt = make_hourly_features(o3_hist, met_fc)
-        
-        # Prepare feature matrices
-        pm_X = pm_ds_rt[pm_feats].ffill(limit=2)
-        o3_X = o3_ds_rt[o3_feats].ffill(limit=2)
-        
-        # ML Predictions
-        pm25_pred = pm_model.predict(pm_X)
-        o3_pred_ugm3 = o3_model.predict(o3_X)
-        o3_pred_ppb = o3_pred_ugm3 * O3_UGM3_TO_PPB
-        
-        # NO2 from CAMS
-        no2_ppb = aq_fc["nitrogen_dioxide"].reindex(pm_X.index) * NO2_UGM3_TO_PPB
-        
-        # Calculate AQI
-        aqi_pm = pd.Series([aqi_from_pm25(v) for v in pm25_pred], index=pm_X.index)
-        aqi_o3 = pd.Series([aqi_from_o3(v) for v in o3_pred_ppb], index=pm_X.index)
-        aqi_no2 = pd.Series([aqi_from_no2_ppb(v) for v in no2_ppb], index=pm_X.index)
-        
-        overall_aqi = pd.concat([aqi_pm, aqi_o3, aqi_no2], axis=1).max(axis=1)
+        # Fetch CAMS air quality history, meteorology forecast and CAMS air
+        # quality forecast concurrently (independent upstream calls)
+        hist_all, met_all, aq_all = await asyncio.gather(
+            fetch_recent_aq_history_many(start_hist, now, locations),
+            fetch_openmeteo_forecast_many(hours, locations, METEO_VARS),
+            fetch_openmeteo_aq_forecast_many(hours, locations),
+        )
+    except Exception as e:
+        return [{"error": str(e), "success": False} for _ in locations]
+    
+    # Feature building and inference are CPU-bound: run them off the event
+    # loop; raises PoolSaturated when the prediction pool is full
+    return await prediction_pool.run(_predict_locations, locations, now, hours, hist_all, met_all, aq_all)
+
+def _predict_locations(locations, now, hours, hist_all, met_all, aq_all):
+    """Features, inference and result records for fetched upstream data (blocking)"""
+    results = [None] * len(locations)
+    
+    # Each location with upstream data owns a row range of one stacked float32
+    # matrix per model; its features are written straight into that range
+    ranges, offset = [], 0
+    for i, (met_fc, aq_fc) in enumerate(zip(met_all, aq_all)):
+        failed = next((fetched for fetched in (met_fc, aq_fc) if isinstance(fetched, Exception)), None)
+        if failed is not None:
+            results[i] = {"error": str(failed), "success": False}
+            continue
+        ranges.append((i, slice(offset, offset + len(met_fc))))
+        offset += len(met_fc)
+    
+    pm_X = np.empty((offset, len(pm_plan)), dtype=np.float32)
+    o3_X = np.empty((offset, len(o3_plan)), dtype=np.float32)
+    inputs = []
+    for i, rows in ranges:
+        try:
+            build_planned_features([pm_plan, o3_plan], met_all[i], hist_all[i], outs=[pm_X[rows], o3_X[rows]])
+            inputs.append((i, rows))
+        except Exception as e:
+            results[i] = {"error": str(e), "success": False}
+            # Rows stay in the batch but their predictions are discarded
+            pm_X[rows] = np.nan
+            o3_X[rows] = np.nan
+    
+    if not inputs:
+        return results
+    
+    # ML Predictions: one call per model over the stacked rows of all locations
+    try:
+        pm25_pred = pm_predict(pm_X)
+        o3_pred_ppb = o3_predict(o3_X) * O3_UGM3_TO_PPB
+    except Exception as e:
+        for i, _ in inputs:
+            results[i] = {"error": str(e), "success": False}
+        return results
+    
+    for i, rows in inputs:
+        lat, lon = locations[i]
+        results[i] = _ml_forecast_result(
+            lat, lon, now, hours, met_all[i].index, pm25_pred[rows], o3_pred_ppb[rows], aq_all[i]
+        )
+    return results
+
+def build_feature_matrices(hist_aq, met_fc):
+    """PM2.5 and O3 model inputs (float32, model column order) for one location"""
+    return build_planned_features([pm_plan, o3_plan], met_fc, hist_aq)
+
+def _ml_forecast_result(lat, lon, now, hours, index, pm25_pred, o3_pred_ppb, aq_fc):
+    try:
+        # NO2 from CAMS, aligned to the feature rows
+        no2_ppb = aq_fc["nitrogen_dioxide"].reindex(index).to_numpy() * NO2_UGM3_TO_PPB
         
-        # Build response
-        forecast = []
-        for idx, aqi_val in overall_aqi.items():
-            forecast.append({
-                "timestamp": idx.isoformat(),
-                "aqi": int(aqi_val) if not pd.isna(aqi_val) else 50,
-                "pm25": float(pm25_pred[pm_X.index.get_loc(idx)]) if idx in pm_X.index else 0,
-                "o3_ppb": float(o3_pred_ppb[o3_X.index.get_loc(idx)]) if idx in o3_X.index else 0,
-                "no2_ppb": float(no2_ppb[idx]) if idx in no2_ppb.index and not pd.isna(no2_ppb[idx]) else 0,
-                "aqi_pm25": int(aqi_pm[idx]) if idx in aqi_pm.index and not pd.isna(aqi_pm[idx]) else 0,
-                "aqi_o3": int(aqi_o3[idx]) if idx in aqi_o3.index and not pd.isna(aqi_o3[idx]) else 0,
-                "aqi_no2": int(aqi_no2[idx]) if idx in aqi_no2.index and not pd.isna(aqi_no2[idx]) else 0,
-            })
+        # Build response positionally from the aligned prediction vectors
+        frame = forecast_frame(index, pm25_pred, o3_pred_ppb, no2_ppb)
+        forecast = forecast_records(frame.iloc[:hours])
         
         # Get current conditions (first forecast point)
         current = forecast[0] if forecast else None
@@ -271,67 +869,56 @@ def get_air_quality_prediction(lat: float, lon: float, hours: int = 72, hist_hou
             "location": {"lat": lat, "lon": lon},
             "generated_at": now.isoformat(),
             "current": current,
-            "forecast": forecast[:hours],
+            "forecast": forecast,
             "model_info": {
                 "pm25_model": "LightGBM trained on 4 years NASA + CAMS data",
                 "o3_model": "LightGBM trained on 4 years NASA + CAMS data",
                 "no2_source": "CAMS forecast (Open-Meteo)"
             }
         }
-    
     except Exception as e:
         return {"error": str(e), "success": False}
 
-def get_cams_forecast_fallback(lat: float, lon: float, hours: int = 72):
+async def get_cams_forecast_fallback(lat: float, lon: float, hours: int = 72):
     """Fallback function using CAMS forecast when ML models are not available"""
+    (result,) = await get_cams_forecast_fallbacks([(lat, lon)], hours)
+    return result
+
+async def get_cams_forecast_fallbacks(locations, hours: int = 72):
+    """CAMS fallback forecasts for many (lat, lon) locations"""
+    now = datetime.now(timezone.utc)
     try:
-        now = datetime.now(timezone.utc)
-        
         # Fetch CAMS air quality forecast
-        aq_fc = fetch_openmeteo_aq_forecast(hours, lat, lon)
+        aq_all = await fetch_openmeteo_aq_forecast_many(hours, locations)
+    except Exception as e:
+        return [{"error": str(e), "success": False} for _ in locations]
+    return [_cams_forecast_result(lat, lon, now, hours, aq_fc) for (lat, lon), aq_fc in zip(locations, aq_all)]
+
+def _cams_forecast_result(lat, lon, now, hours, aq_fc):
+    try:
+        if isinstance(aq_fc, Exception):
+            raise aq_fc
         
         if aq_fc.empty:
             return {"error": "No forecast data available", "success": False}
         
-        # Build forecast from CAMS data
-        forecast = []
-        for idx, row in aq_fc.iterrows():
-            pm25 = row.get("pm2_5", 0)
-            o3_ugm3 = row.get("ozone", 0)
-            o3_ppb = o3_ugm3 * O3_UGM3_TO_PPB
-            no2_ppb = row.get("nitrogen_dioxide", 0) * NO2_UGM3_TO_PPB
-            
-            # Calculate AQI
-            aqi_pm = aqi_from_pm25(pm25)
-            aqi_o3 = aqi_from_o3(o3_ppb)
-            aqi_no2 = aqi_from_no2_ppb(no2_ppb)
-            
-            overall_aqi = max(aqi_pm, aqi_o3, aqi_no2)
-            
-            # Determine dominant pollutant
-            dominant = "PM2.5"
-            if aqi_o3 > aqi_pm and aqi_o3 >= aqi_no2:
-                dominant = "O3"
-            elif aqi_no2 > aqi_pm and aqi_no2 > aqi_o3:
-                dominant = "NO2"
-            
-            forecast.append({
-                "timestamp": idx.isoformat(),
-                "aqi": int(overall_aqi) if not pd.isna(overall_aqi) else 50,
-                "pm25": float(pm25),
-                "o3_ppb": float(o3_ppb),
-                "no2_ppb": float(no2_ppb),
-                "aqi_pm25": int(aqi_pm) if not pd.isna(aqi_pm) else 0,
-                "aqi_o3": int(aqi_o3) if not pd.isna(aqi_o3) else 0,
-                "aqi_no2": int(aqi_no2) if not pd.isna(aqi_no2) else 0,
-            })
+        # Columnar pipeline over all hours; records are only built at the end
+        aq_fc = aq_fc.iloc[:hours]
+        zeros = pd.Series(0.0, index=aq_fc.index)
+        frame = forecast_frame(
+            aq_fc.index,
+            aq_fc.get("pm2_5", zeros).to_numpy(),
+            aq_fc.get("ozone", zeros).to_numpy() * O3_UGM3_TO_PPB,
+            aq_fc.get("nitrogen_dioxide", zeros).to_numpy() * NO2_UGM3_TO_PPB,
+        )
+        forecast = forecast_records(frame)
         
         return {
             "success": True,
             "location": {"lat": lat, "lon": lon},
             "generated_at": now.isoformat(),
             "current": forecast[0] if forecast else None,
-            "forecast": forecast[:hours],
+            "forecast": forecast,
             "model_info": {
                 "data_source": "CAMS (Copernicus Atmosphere Monitoring Service)",
                 "note": "Using CAMS forecast data (ML models disabled for deployment)"
@@ -340,26 +927,37 @@ def get_cams_forecast_fallback(lat: float, lon: float, hours: int = 72):
     except Exception as e:
         return {"error": str(e), "success": False}
 
-def get_current_conditions(lat: float, lon: float):
+async def get_current_conditions(lat: float, lon: float):
     """Get current air quality and weather using CAMS and Open-Meteo data"""
+    (current,) = await get_current_conditions_many([(lat, lon)])
+    return current
+
+async def get_current_conditions_many(locations):
+    """Current conditions for many (lat, lon) locations (None where unavailable)"""
     try:
-        # Fetch air quality data
+        # Air quality and weather are fetched concurrently, many locations per request
         aq_params = {
-            "latitude": lat,
-            "longitude": lon,
             "current": "pm2_5,pm10,ozone,nitrogen_dioxide,sulphur_dioxide,carbon_monoxide",
             "timezone": "UTC"
         }
-        aq_js = get_json(AQ_API, aq_params)
-        
-        # Fetch weather data
         weather_params = {
-            "latitude": lat,
-            "longitude": lon,
             "current": "temperature_2m,relative_humidity_2m,wind_speed_10m,wind_direction_10m,visibility",
             "timezone": "UTC"
         }
-        weather_js = get_json(OPEN_METEO_FC, weather_params)
+        aq_all, weather_all = await asyncio.gather(
+            fetch_upstream_many(AQ_API, aq_params, locations, return_exceptions=True),
+            fetch_upstream_many(OPEN_METEO_FC, weather_params, locations, return_exceptions=True),
+        )
+    except Exception as e:
+        print(f"Error fetching current conditions: {e}")
+        return [None] * len(locations)
+    return [_current_conditions(aq_js, weather_js) for aq_js, weather_js in zip(aq_all, weather_all)]
+
+def _current_conditions(aq_js, weather_js):
+    try:
+        for fetched in (aq_js, weather_js):
+            if isinstance(fetched, Exception):
+                raise fetched
         
         if "current" not in aq_js:
             return None
@@ -0,0 +1,110 @@
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+import ml_service
+
+# Multi-worker launch: the parent loads the ML models (and compiles feature
+# plans / tree tables) once, freezes the heap, binds the listening socket and
+# forks WEB_WORKERS uvicorn workers. Children share the model pages
+# copy-on-write instead of each loading its own copy.
+PREFORK_REPORT_DELAY = float(os.getenv("PREFORK_REPORT_DELAY", "3"))
+
+
+def memory_usage(pid="self"):
+    """RSS / PSS / shared / private memory in MB from /proc (Linux), or None"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line[0].isdigit())
+    except OSError:
+        return None
+    kb = {name: int(value.split()[0]) for name, value in fields.items() if value.strip().endswith("kB")}
+    mb = lambda *names: round(sum(kb.get(name, 0) for name in names) / 1024, 1)
+    return {
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+        "private_mb": mb("Private_Clean", "Private_Dirty"),
+    }
+
+
+def report_memory(pids):
+    """Print per-worker memory; PSS splits shared pages between processes"""
+    rows = [("parent", os.getpid(), memory_usage())] + [("worker", pid, memory_usage(pid)) for pid in pids]
+    if any(usage is None for _, _, usage in rows):
+        print("Per-worker memory report unavailable (needs /proc/<pid>/smaps_rollup)")
+        return
+    for role, pid, usage in rows:
+        print(f"  {role:<6} pid {pid:<7} RSS {usage['rss_mb']:8.1f} MB   PSS {usage['pss_mb']:8.1f} MB   "
+              f"shared {usage['shared_mb']:8.1f} MB   private {usage['private_mb']:8.1f} MB")
+    total_rss = sum(usage["rss_mb"] for _, _, usage in rows)
+    total_pss = sum(usage["pss_mb"] for _, _, usage in rows)
+    print(f"  total  RSS {total_rss:.1f} MB (double counts shared pages), PSS {total_pss:.1f} MB")
+
+
+def serve_prefork(app, host: str, port: int, workers: int):
+    """Load models once, then fork ``workers`` uvicorn processes on one socket"""
+    gc.disable()
+    ml_service.load_models()
+    # Move everything loaded so far out of the collector's reach so GC passes
+    # in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            gc.enable()
+            server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+            server.run(sockets=[sock])
+            os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Prefork: {workers} workers on {host}:{port}, models loaded={ml_service.MODELS_LOADED} in parent {os.getpid()}")
+    for _ in range(workers):
+        spawn()
+
+    time.sleep(PREFORK_REPORT_DELAY)
+    if not stopping:
+        report_memory(sorted(children))
+
+    # Supervise: restart workers that die until asked to stop
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            spawn()
+    sock.close()
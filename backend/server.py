@@ -1,23 +1,70 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+import asyncio
 import os
 from dotenv import load_dotenv
 import uvicorn
 
 # Import ML service
-from ml_service import get_air_quality_prediction, get_current_conditions, MODELS_LOADED
+from ml_service import (
+    get_air_quality_prediction, get_air_quality_predictions, get_current_conditions,
+    get_current_conditions_many,
+    close_http_client, cache_stats, snap_coord, upstream_bucket, load_models_in_background,
+    prediction_pool,
+)
+import ml_service
+from cache import StaleWhileRevalidateCache, warm_caches
+from workers import PoolSaturated
+from map_grid import get_aqi_grid, get_aqi_grid_columns, map_tile_cache
+from history_store import HISTORY_MAX_HOURS, current_hour, history_frame, history_store
+from compact import COLUMNAR, encode_response, forecast_columns, map_columns, wants_msgpack
+from map_tiles import (
+    TILE_MAX_ZOOM, TILE_PREWARM_ZOOM, get_aqi_tile, prewarm_pyramid, tile_etag, tile_expires_at,
+)
 
 load_dotenv()
 
+# Formatted /api/forecast payloads, keyed by snapped location and horizon
+FORECAST_CACHE_MB = int(os.getenv("FORECAST_CACHE_MB", "64"))
+FORECAST_FRESH_SECONDS = int(os.getenv("FORECAST_FRESH_SECONDS", "600"))
+FORECAST_STALE_SECONDS = int(os.getenv("FORECAST_STALE_SECONDS", "3600"))
+FORECAST_GRID_DEG = 0.1
+MAX_BATCH_LOCATIONS = int(os.getenv("MAX_BATCH_LOCATIONS", "500"))
+
+forecast_cache = StaleWhileRevalidateCache(
+    "forecast", FORECAST_CACHE_MB * 1024 * 1024, FORECAST_FRESH_SECONDS, FORECAST_STALE_SECONDS
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load in the background; forecasts use CAMS until they are ready
+    model_loading = asyncio.create_task(load_models_in_background())
+    # Reload cached upstream data and forecasts persisted by earlier runs
+    cache_warming = asyncio.create_task(warm_caches())
+    # Keep the low-zoom tile pyramid rendered for each CAMS update
+    prewarm = asyncio.create_task(prewarm_pyramid()) if TILE_PREWARM_ZOOM >= 0 else None
+    yield
+    if prewarm is not None:
+        prewarm.cancel()
+    cache_warming.cancel()
+    if not model_loading.done():
+        print("Shutting down while ML models are still loading")
+    prediction_pool.shutdown()
+    # Release pooled upstream connections on shutdown
+    await close_http_client()
+
 app = FastAPI(
     title="Skyphoria AirCast API",
     description="Real-time Air Quality Forecasting with ML Models",
     version="2.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -29,11 +76,28 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    # Shed load instead of queueing without bound; clients back off and retry
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 class Location(BaseModel):
     lat: float
     lon: float
     name: Optional[str] = None
 
+class BatchLocationsRequest(BaseModel):
+    locations: List[Location]
+
+class BatchForecastRequest(BaseModel):
+    locations: List[Location]
+    hours: int = 72
+    hist_hours: int = 72
+
 # Helper function
 def get_aqi_category(aqi: int) -> Dict[str, Any]:
     if aqi <= 50:
@@ -49,37 +113,7 @@ def get_aqi_category(aqi: int) -> Dict[str, Any]:
     else:
         return {"name": "Hazardous", "color": "#880E4F", "level": 6}
 
-@app.get("/")
-async def root():
-    return {
-        "message": "Skyphoria AirCast API - ML-Powered Air Quality Forecasting",
-        "version": "2.0.0",
-        "ml_models_loaded": MODELS_LOADED,
-        "data_sources": ["NASA DONKI", "Open-Meteo CAMS", "OpenAQ"],
-        "status": "operational"
-    }
-
-@app.get("/api/health")
-async def health_check():
-    return {
-        "status": "healthy",
-        "ml_models": MODELS_LOADED,
-        "timestamp": datetime.utcnow().isoformat() + "Z"
-    }
-
-@app.get("/api/current")
-async def get_current(
-    lat: float = Query(..., description="Latitude"),
-    lon: float = Query(..., description="Longitude"),
-    location: Optional[str] = Query(None, description="Location name")
-):
-    """Get current air quality using real CAMS data"""
-    
-    current_data = get_current_conditions(lat, lon)
-    
-    if not current_data:
-        raise HTTPException(status_code=500, detail="Failed to fetch current conditions")
-    
+def format_current(lat: float, lon: float, location: Optional[str], current_data: Dict[str, Any]) -> Dict[str, Any]:
     category = get_aqi_category(current_data["aqi"])
     
     return {
@@ -149,20 +183,14 @@ async def get_current(
         "ml_powered": True
     }
 
-@app.get("/api/forecast")
-async def get_forecast(
-    lat: float = Query(..., description="Latitude"),
-    lon: float = Query(..., description="Longitude"),
-    hours: int = Query(72, description="Forecast hours"),
-    hist_hours: int = Query(72, description="Historical hours for model")
-):
-    """Get ML-powered air quality forecast"""
-    
-    result = get_air_quality_prediction(lat, lon, hours, hist_hours)
-    
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error", "Prediction failed"))
-    
+def forecast_cache_key(lat: float, lon: float, hours: int, hist_hours: int):
+    # CAMS fallbacks served while models load are not reused once they are ready
+    return (
+        snap_coord(lat, FORECAST_GRID_DEG), snap_coord(lon, FORECAST_GRID_DEG), hours, hist_hours,
+        ml_service.MODELS_LOADED,
+    )
+
+def format_forecast(result: Dict[str, Any]) -> Dict[str, Any]:
     # Format forecast data
     forecast_data = []
     for item in result["forecast"]:
@@ -189,39 +217,194 @@ async def get_forecast(
         "ml_powered": True
     }
 
+@app.get("/")
+async def root():
+    return {
+        "message": "Skyphoria AirCast API - ML-Powered Air Quality Forecasting",
+        "version": "2.0.0",
+        "ml_models_loaded": ml_service.MODELS_LOADED,
+        "data_sources": ["NASA DONKI", "Open-Meteo CAMS", "OpenAQ"],
+        "status": "operational"
+    }
+
+@app.get("/api/health")
+async def health_check():
+    return {
+        "status": "healthy",
+        "ml_models": ml_service.MODELS_LOADED,
+        "ml_models_state": ml_service.MODELS_STATE,
+        "prediction_pool": prediction_pool.stats(),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and memory usage of the in-process caches"""
+    return {**cache_stats(), "forecast": forecast_cache.stats(), "map": map_tile_cache.stats()}
+
+@app.get("/api/current")
+async def get_current(
+    lat: float = Query(..., description="Latitude"),
+    lon: float = Query(..., description="Longitude"),
+    location: Optional[str] = Query(None, description="Location name")
+):
+    """Get current air quality using real CAMS data"""
+    
+    current_data = await get_current_conditions(lat, lon)
+    
+    if not current_data:
+        raise HTTPException(status_code=500, detail="Failed to fetch current conditions")
+    
+    return format_current(lat, lon, location, current_data)
+
+@app.post("/api/current/batch")
+async def get_current_batch(request: BatchLocationsRequest):
+    """Get current air quality for many locations in one round-trip"""
+    
+    if len(request.locations) > MAX_BATCH_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_LOCATIONS} locations per batch")
+    
+    conditions = await get_current_conditions_many([(loc.lat, loc.lon) for loc in request.locations])
+    
+    results = []
+    for loc, current_data in zip(request.locations, conditions):
+        if not current_data:
+            results.append({
+                "location": {"lat": loc.lat, "lon": loc.lon, "name": loc.name},
+                "success": False,
+                "error": "Failed to fetch current conditions"
+            })
+        else:
+            results.append({**format_current(loc.lat, loc.lon, loc.name, current_data), "success": True})
+    
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "count": len(results),
+        "results": results
+    }
+
+@app.get("/api/forecast")
+async def get_forecast(
+    response: Response,
+    lat: float = Query(..., description="Latitude"),
+    lon: float = Query(..., description="Longitude"),
+    hours: int = Query(72, description="Forecast hours"),
+    hist_hours: int = Query(72, description="Historical hours for model"),
+    format: Optional[str] = Query(None, pattern=f"^{COLUMNAR}$", description="'columnar' for column arrays"),
+    accept: Optional[str] = Header(None),
+):
+    """Get ML-powered air quality forecast"""
+    
+    async def compute():
+        result = await get_air_quality_prediction(lat, lon, hours, hist_hours)
+        if not result.get("success"):
+            raise HTTPException(status_code=500, detail=result.get("error", "Prediction failed"))
+        return format_forecast(result)
+    
+    key = forecast_cache_key(lat, lon, hours, hist_hours)
+    payload = await forecast_cache.get_or_compute(key, compute)
+    payload = {**payload, "location": {"lat": lat, "lon": lon}}
+    if format == COLUMNAR:
+        payload = forecast_columns(payload)
+    if format == COLUMNAR or wants_msgpack(accept):
+        return encode_response(payload, accept)
+    response.headers["Vary"] = "Accept"
+    return payload
+
+@app.post("/api/forecast/batch")
+async def get_forecast_batch(
+    request: BatchForecastRequest,
+    response: Response,
+    format: Optional[str] = Query(None, pattern=f"^{COLUMNAR}$", description="'columnar' for column arrays"),
+    accept: Optional[str] = Header(None),
+):
+    """Get ML-powered forecasts for many locations in one model pass"""
+    
+    if len(request.locations) > MAX_BATCH_LOCATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_LOCATIONS} locations per batch")
+    
+    keys = [forecast_cache_key(loc.lat, loc.lon, request.hours, request.hist_hours) for loc in request.locations]
+    payloads = {key: forecast_cache.peek(key) for key in keys}
+    
+    # Locations without a fresh cached forecast are predicted together
+    missing = {}
+    for key, loc in zip(keys, request.locations):
+        if payloads[key] is None:
+            missing.setdefault(key, (loc.lat, loc.lon))
+    if missing:
+        results = await get_air_quality_predictions(list(missing.values()), request.hours, request.hist_hours)
+        for key, result in zip(missing, results):
+            if result.get("success"):
+                payloads[key] = format_forecast(result)
+                forecast_cache.put(key, payloads[key])
+            else:
+                payloads[key] = {"error": result.get("error", "Prediction failed")}
+    
+    results = []
+    for key, loc in zip(keys, request.locations):
+        location = {"lat": loc.lat, "lon": loc.lon, "name": loc.name}
+        payload = payloads[key]
+        if "error" in payload:
+            results.append({"location": location, "success": False, "error": payload["error"]})
+        elif format == COLUMNAR:
+            results.append({**forecast_columns(payload), "location": location, "success": True})
+        else:
+            results.append({**payload, "location": location, "success": True})
+    
+    body = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "count": len(results),
+        "results": results
+    }
+    if format == COLUMNAR or wants_msgpack(accept):
+        return encode_response(body, accept)
+    # JSON and MessagePack variants share the URL: keep shared caches apart
+    response.headers["Vary"] = "Accept"
+    return body
+
 @app.get("/api/historical")
 async def get_historical(
     lat: float = Query(...),
     lon: float = Query(...),
-    hours: int = Query(48)
+    hours: int = Query(48, ge=1, le=HISTORY_MAX_HOURS)
 ):
-    """Get historical air quality data"""
-    from datetime import datetime, timedelta, timezone
-    import random
+    """Get historical air quality data from the local CAMS history store"""
+    end = current_hour()
+    start = end - timedelta(hours=hours - 1)
+    history, failures = await history_store.query(lat, lon, start, end)
+    # Nothing stored and upstream failed: an error, not an empty history
+    if failures and history.empty:
+        raise HTTPException(status_code=502, detail=f"Historical data unavailable: {failures[0]['error']}")
+    frame = history_frame(history)
     
-    # Generate mock historical data
     data = []
-    now = datetime.now(timezone.utc)
-    
-    for i in range(hours):
-        timestamp = now - timedelta(hours=hours - i)
-        aqi = random.randint(40, 120)
+    for timestamp, aqi, pm25, o3, no2 in zip(
+        frame.index,
+        frame["aqi"].round().astype(int).tolist(),
+        frame["pm25"].tolist(),
+        frame["o3_ppb"].tolist(),
+        frame["no2_ppb"].tolist(),
+    ):
         category = get_aqi_category(aqi)
-        
         data.append({
             "timestamp": timestamp.isoformat(),
             "aqi": aqi,
             "category": category["name"],
             "categoryColor": category["color"],
-            "pm25": round(random.uniform(5, 35), 1),
-            "o3": round(random.uniform(20, 80), 1),
-            "no2": round(random.uniform(10, 60), 1)
+            "pm25": None if pm25 != pm25 else round(pm25, 1),
+            "o3": None if o3 != o3 else round(o3, 1),
+            "no2": None if no2 != no2 else round(no2, 1)
         })
     
-    return {
+    response = {
         "location": {"lat": lat, "lon": lon},
-        "data": data
+        "data": data,
+        # Some of the requested range could not be fetched from upstream
+        "partial": bool(failures),
     }
+    if failures:
+        response["missing"] = [{"start": f["start_date"], "end": f["end_date"]} for f in failures]
+    return response
 
 @app.get("/api/sensors")
 async def get_sensors(
@@ -234,32 +417,52 @@ async def get_sensors(
 
 @app.get("/api/map/data")
 async def get_map_data(
+    response: Response,
     north: float = Query(...),
     south: float = Query(...),
     east: float = Query(...),
-    west: float = Query(...)
+    west: float = Query(...),
+    grid_size: int = Query(20, ge=2, le=64),
+    format: Optional[str] = Query(None, pattern=f"^{COLUMNAR}$", description="'columnar' for column arrays"),
+    accept: Optional[str] = Header(None),
 ):
-    """Generate heat map data"""
-    import random
-    grid_size = 20
-    lat_step = (north - south) / grid_size
-    lon_step = (east - west) / grid_size
-    
-    heatmap_data = []
-    for i in range(grid_size):
-        for j in range(grid_size):
-            lat = south + i * lat_step
-            lon = west + j * lon_step
-            aqi = random.randint(40, 120)
-            heatmap_data.append({
-                "lat": lat,
-                "lon": lon,
-                "aqi": aqi,
-                "intensity": aqi / 500
-            })
-    
-    return {"data": heatmap_data}
+    """Gridded AQI heat map for the bounds"""
+    try:
+        if format == COLUMNAR:
+            columns = await get_aqi_grid_columns(north, south, east, west, grid_size)
+            return encode_response(map_columns(columns), accept)
+        grid = await get_aqi_grid(north, south, east, west, grid_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bounds: {e}")
+    if wants_msgpack(accept):
+        return encode_response(grid, accept)
+    response.headers["Vary"] = "Accept"
+    return grid
+
+@app.get("/api/tiles/{z}/{x}/{y}")
+async def get_tile(z: int, x: int, y: int, if_none_match: Optional[str] = Header(None)):
+    """AQI raster tile (Web Mercator z/x/y, 256px PNG)"""
+    if not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    bucket = upstream_bucket()
+    max_age = max(int(tile_expires_at(bucket) - datetime.now(timezone.utc).timestamp()), 0)
+    headers = {"ETag": tile_etag(z, x, y, bucket), "Cache-Control": f"public, max-age={max_age}"}
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    png, complete = await get_aqi_tile(z, x, y, bucket)
+    if not complete:
+        # Holes from upstream failures: no validator, so the 304 shortcut above
+        # can never confirm this tile and clients fetch it again
+        headers = {"Cache-Control": "no-store"}
+    return Response(content=png, media_type="image/png", headers=headers)
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8001))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.getenv("WEB_WORKERS", "1"))
+    if workers > 1:
+        # Models load once in the parent and are shared copy-on-write
+        from prefork import serve_prefork
+        serve_prefork(app, "0.0.0.0", port, workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+import numpy as np
+
+# LightGBM treats |x| <= kZeroThreshold as an absent (zero) feature value
+LGBM_ZERO_THRESHOLD = 1e-35
+
+# Objectives whose prediction is the raw score
+IDENTITY_OBJECTIVES = ("regression", "regression_l1", "huber", "fair", "quantile", "mape")
+
+
+class NumpyForest:
+    """Vectorized evaluator for a LightGBM regression ensemble.
+
+    Compiled from ``booster.dump_model()`` into per-feature lookup tables in
+    the style of QuickScorer: leaves of each tree are numbered left to right
+    and every split that evaluates false (x > threshold) clears the bits of
+    the leaves in its left subtree. Thresholds of one feature are bin
+    boundaries, so for each feature the AND of those masks over all splits
+    with threshold < x is precomputed per tree and indexed by
+    ``searchsorted(thresholds, x)``. The exit leaf of a tree is the lowest
+    bit left set after combining all features. Leaf values are summed in
+    tree order, so results match ``booster.predict`` exactly.
+
+    Raises NotImplementedError for models it cannot reproduce exactly
+    (categorical or non-'None' missing-value splits, multiclass, linear
+    trees, transformed objectives).
+    """
+
+    def __init__(self, booster, block_rows: int = 256):
+        dump = booster.dump_model()
+        objective = dump["objective"].split()[0]
+        if objective not in IDENTITY_OBJECTIVES:
+            raise NotImplementedError(f"objective {objective!r}")
+        if dump["num_tree_per_iteration"] != 1 or dump.get("average_output"):
+            raise NotImplementedError("multiclass or averaged ensembles")
+
+        trees = dump["tree_info"]
+        max_leaves = max(tree["num_leaves"] for tree in trees)
+        if max_leaves > 64:
+            raise NotImplementedError(f"trees with {max_leaves} leaves")
+        self.dtype = np.uint32 if max_leaves <= 32 else np.uint64
+        self.all_leaves = self.dtype(np.iinfo(self.dtype).max)
+        self.n_trees = len(trees)
+        self.n_features = dump["max_feature_idx"] + 1
+        self.block_rows = block_rows
+
+        self.leaf_values = np.zeros((self.n_trees, max_leaves))
+        splits = defaultdict(list)
+        for t, tree in enumerate(trees):
+            if tree.get("num_cat") or tree.get("is_linear"):
+                raise NotImplementedError("categorical or linear trees")
+            leaves = []
+            self._walk(tree["tree_structure"], t, leaves, splits)
+            self.leaf_values[t, :len(leaves)] = leaves
+
+        # Per feature: sorted distinct thresholds and the cumulative masks
+        # table[k] = AND of masks of splits whose threshold is among the first k
+        self.tables = []
+        for feature in sorted(splits):
+            thresholds, tree_ids, masks = (np.array(column) for column in zip(*splits[feature]))
+            unique = np.unique(thresholds)
+            rank = np.searchsorted(unique, thresholds)
+            order = np.argsort(rank, kind="stable")
+            bounds = np.searchsorted(rank[order], np.arange(len(unique) + 1))
+            table = np.empty((len(unique) + 1, self.n_trees), dtype=self.dtype)
+            current = np.full(self.n_trees, self.all_leaves, dtype=self.dtype)
+            table[0] = current
+            for k in range(len(unique)):
+                group = order[bounds[k]:bounds[k + 1]]
+                np.bitwise_and.at(current, tree_ids[group], masks[group].astype(self.dtype))
+                table[k + 1] = current
+            self.tables.append((feature, unique, table))
+        self._tree_ids = np.arange(self.n_trees)
+
+    def _walk(self, node, tree_id, leaves, splits):
+        """Number leaves left to right; returns the [first, last) leaf range of ``node``"""
+        if "split_index" not in node:
+            leaves.append(node["leaf_value"])
+            return len(leaves) - 1, len(leaves)
+        if node["decision_type"] != "<=" or node["missing_type"] != "None":
+            raise NotImplementedError(f"split {node['decision_type']} / missing {node['missing_type']}")
+        first, middle = self._walk(node["left_child"], tree_id, leaves, splits)
+        _, last = self._walk(node["right_child"], tree_id, leaves, splits)
+        left_bits = ((1 << middle) - 1) ^ ((1 << first) - 1)
+        splits[node["split_feature"]].append((node["threshold"], tree_id, int(self.all_leaves) & ~left_bits))
+        return first, last
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected (n, {self.n_features}) input, got {X.shape}")
+        # With missing type 'None' LightGBM evaluates NaN (and ~0) as 0.0
+        X = np.where(np.isnan(X) | (np.abs(X) <= LGBM_ZERO_THRESHOLD), 0.0, X)
+
+        out = np.empty(len(X))
+        for start in range(0, len(X), self.block_rows):
+            rows = X[start:start + self.block_rows]
+            mask = np.full((len(rows), self.n_trees), self.all_leaves, dtype=self.dtype)
+            for feature, thresholds, table in self.tables:
+                mask &= table[np.searchsorted(thresholds, rows[:, feature], side="left")]
+            # Index of the lowest set bit = exit leaf
+            lowest = mask & (~mask + self.dtype(1))
+            leaf = np.log2(lowest).astype(np.intp)
+            values = self.leaf_values[self._tree_ids, leaf]
+            # Sequential (not pairwise) sum reproduces LightGBM's accumulation order
+            out[start:start + len(rows)] = np.cumsum(values, axis=1)[:, -1]
+        return out
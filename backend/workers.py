@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """Raised instead of queueing when a WorkerPool is at capacity"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} pool is saturated, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """Bounded thread pool for CPU-bound work called from the event loop.
+
+    At most ``workers`` jobs run at once and ``queue_depth`` more may wait;
+    beyond that ``run`` raises PoolSaturated immediately with a Retry-After
+    estimate from recent job durations. NumPy, pandas and LightGBM release
+    the GIL for their heavy loops, and threads share the loaded models.
+    Admission is tracked on the event loop, like the caches.
+    """
+
+    def __init__(self, name: str, workers: int, queue_depth: int):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.queue_depth = max(queue_depth, 0)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=name)
+        self._pending = 0
+        self._avg_seconds = 0.0
+        self.completed = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free"""
+        waves = math.ceil((self._pending + 1) / self.workers)
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._pending >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise PoolSaturated(self.name, self.retry_after())
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        started = time.perf_counter()
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        # The slot is released when the job ends, even if the caller gave up
+        future.add_done_callback(lambda _: self._release(loop, started))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop, started: float):
+        try:
+            loop.call_soon_threadsafe(self._finished, started)
+        except RuntimeError:
+            pass  # loop already closed at shutdown
+
+    def _finished(self, started: float):
+        self._pending -= 1
+        elapsed = time.perf_counter() - started
+        # Exponential moving average of queue + run time per job
+        self._avg_seconds = elapsed if not self.completed else 0.8 * self._avg_seconds + 0.2 * elapsed
+        self.completed += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_job_ms": round(self._avg_seconds * 1000, 1),
+        }
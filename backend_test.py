@@ -50,7 +50,7 @@ class BackendTester:
             data = response.json()
             
             # Validate required fields
-            required_fields = ["status", "ml_models", "timestamp"]
+            required_fields = ["status", "ml_models", "prediction_pool", "timestamp"]
             missing_fields = [field for field in required_fields if field not in data]
             
             if missing_fields:
@@ -165,6 +165,55 @@ class BackendTester:
             self.log_result("Current Air Quality", False, f"Request failed: {str(e)}")
             return False
     
+    def test_batch_current(self):
+        """Test POST /api/current/batch endpoint"""
+        try:
+            payload = {
+                "locations": [
+                    {"lat": TEST_LAT, "lon": TEST_LON, "name": "New York"},
+                    {"lat": 41.8781, "lon": -87.6298, "name": "Chicago"}
+                ]
+            }
+            response = self.session.post(f"{BACKEND_URL}/api/current/batch", json=payload)
+            
+            if response.status_code != 200:
+                self.log_result("Batch Current Air Quality", False, f"Expected 200, got {response.status_code}")
+                return False
+                
+            data = response.json()
+            
+            results = data.get("results")
+            if not isinstance(results, list) or len(results) != len(payload["locations"]):
+                self.log_result("Batch Current Air Quality", False, f"Expected {len(payload['locations'])} results, got {len(results) if isinstance(results, list) else 'N/A'}")
+                return False
+            
+            # Each result has the same shape as /api/current
+            required_fields = ["location", "timestamp", "aqi", "category", "categoryColor",
+                               "dominantPollutant", "confidence", "weather", "pollutants"]
+            for requested, result in zip(payload["locations"], results):
+                if not result.get("success"):
+                    self.log_result("Batch Current Air Quality", False, f"Failed for {requested['name']}: {result.get('error')}")
+                    return False
+                missing_fields = [field for field in required_fields if field not in result]
+                if missing_fields:
+                    self.log_result("Batch Current Air Quality", False, f"Missing fields for {requested['name']}: {missing_fields}")
+                    return False
+                if result["location"]["name"] != requested["name"]:
+                    self.log_result("Batch Current Air Quality", False, f"Result order mismatch: expected {requested['name']}, got {result['location']['name']}")
+                    return False
+            
+            sample_data = {
+                "count": data["count"],
+                "aqi": {result["location"]["name"]: result["aqi"] for result in results}
+            }
+            
+            self.log_result("Batch Current Air Quality", True, f"Current conditions validated for {len(results)} locations", sample_data)
+            return True
+            
+        except Exception as e:
+            self.log_result("Batch Current Air Quality", False, f"Request failed: {str(e)}")
+            return False
+    
     def test_ml_forecast(self):
         """Test GET /api/forecast endpoint"""
         try:
@@ -231,6 +280,59 @@ class BackendTester:
             self.log_result("ML Forecast", False, f"Request failed: {str(e)}")
             return False
     
+    def test_batch_forecast(self):
+        """Test POST /api/forecast/batch endpoint"""
+        try:
+            payload = {
+                "locations": [
+                    {"lat": TEST_LAT, "lon": TEST_LON, "name": "New York"},
+                    {"lat": 34.0522, "lon": -118.2437, "name": "Los Angeles"}
+                ],
+                "hours": 24
+            }
+            response = self.session.post(f"{BACKEND_URL}/api/forecast/batch", json=payload)
+            
+            if response.status_code != 200:
+                self.log_result("Batch Forecast", False, f"Expected 200, got {response.status_code}")
+                return False
+                
+            data = response.json()
+            
+            results = data.get("results")
+            if not isinstance(results, list) or len(results) != len(payload["locations"]):
+                self.log_result("Batch Forecast", False, f"Expected {len(payload['locations'])} results, got {len(results) if isinstance(results, list) else 'N/A'}")
+                return False
+            
+            # Results come back in request order with the same shape as /api/forecast
+            for requested, result in zip(payload["locations"], results):
+                if not result.get("success"):
+                    self.log_result("Batch Forecast", False, f"Forecast failed for {requested['name']}: {result.get('error')}")
+                    return False
+                if result["location"]["name"] != requested["name"]:
+                    self.log_result("Batch Forecast", False, f"Result order mismatch: expected {requested['name']}, got {result['location']['name']}")
+                    return False
+                required_fields = ["location", "generated_at", "forecast", "model_info", "ml_powered"]
+                missing_fields = [field for field in required_fields if field not in result]
+                if missing_fields:
+                    self.log_result("Batch Forecast", False, f"Missing fields for {requested['name']}: {missing_fields}")
+                    return False
+                if len(result["forecast"]) == 0:
+                    self.log_result("Batch Forecast", False, f"Empty forecast for {requested['name']}")
+                    return False
+            
+            sample_data = {
+                "count": data["count"],
+                "first_location": results[0]["location"]["name"],
+                "first_aqi": results[0]["forecast"][0]["aqi"]
+            }
+            
+            self.log_result("Batch Forecast", True, f"Batch forecast validated for {len(results)} locations", sample_data)
+            return True
+            
+        except Exception as e:
+            self.log_result("Batch Forecast", False, f"Request failed: {str(e)}")
+            return False
+    
     def test_historical_data(self):
         """Test GET /api/historical endpoint"""
         try:
@@ -244,7 +346,7 @@ class BackendTester:
             data = response.json()
             
             # Validate structure
-            required_fields = ["location", "data"]
+            required_fields = ["location", "data", "partial"]
             missing_fields = [field for field in required_fields if field not in data]
             if missing_fields:
                 self.log_result("Historical Data", False, f"Missing fields: {missing_fields}")
@@ -306,6 +408,9 @@ class BackendTester:
             if "data" not in data:
                 self.log_result("Map Data", False, "Missing 'data' field")
                 return False
+            if "resolution" not in data:
+                self.log_result("Map Data", False, "Missing 'resolution' field")
+                return False
             
             # Validate heatmap data
             heatmap_data = data["data"]
@@ -354,6 +459,37 @@ class BackendTester:
             self.log_result("Map Data", False, f"Request failed: {str(e)}")
             return False
     
+    def test_map_tile(self):
+        """Test GET /api/tiles/{z}/{x}/{y} endpoint"""
+        try:
+            response = self.session.get(f"{BACKEND_URL}/api/tiles/3/1/3")
+            
+            if response.status_code != 200:
+                self.log_result("Map Tile", False, f"Expected 200, got {response.status_code}")
+                return False
+            
+            if response.headers.get("content-type") != "image/png" or not response.content.startswith(b"\x89PNG"):
+                self.log_result("Map Tile", False, "Response is not a PNG image")
+                return False
+            
+            etag = response.headers.get("etag")
+            if not etag:
+                self.log_result("Map Tile", False, "Missing ETag header")
+                return False
+            
+            # Revalidation with the ETag should not resend the tile
+            revalidated = self.session.get(f"{BACKEND_URL}/api/tiles/3/1/3", headers={"If-None-Match": etag})
+            if revalidated.status_code != 304:
+                self.log_result("Map Tile", False, f"Expected 304 on revalidation, got {revalidated.status_code}")
+                return False
+            
+            self.log_result("Map Tile", True, f"PNG tile of {len(response.content)} bytes with ETag {etag}")
+            return True
+            
+        except Exception as e:
+            self.log_result("Map Tile", False, f"Request failed: {str(e)}")
+            return False
+    
     def run_all_tests(self):
         """Run all backend tests"""
         print(f"🚀 Starting Backend API Testing for Skyphoria")
@@ -364,9 +500,12 @@ class BackendTester:
         tests = [
             self.test_health_check,
             self.test_current_air_quality,
+            self.test_batch_current,
             self.test_ml_forecast,
+            self.test_batch_forecast,
             self.test_historical_data,
-            self.test_map_data
+            self.test_map_data,
+            self.test_map_tile
         ]
         
         passed = 0
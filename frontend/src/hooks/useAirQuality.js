@@ -21,6 +21,23 @@ export const useCurrentAirQuality = (lat, lon, location = null, options = {}) =>
   })
 }
 
+export const useCurrentAirQualityBatch = (locations, options = {}) => {
+  return useQuery({
+    queryKey: ['airQuality', 'current', 'batch', locations.map(({ lat, lon }) => [lat, lon])],
+    queryFn: () => airQualityAPI.getCurrentAQBatch(locations),
+    enabled: locations.length > 0,
+    refetchInterval: 5 * 60 * 1000, // Refetch every 5 minutes
+    retry: 3,
+    retryDelay: (attemptIndex) => Math.min(1000 * 2 ** attemptIndex, 30000),
+    onError: (error) => {
+      console.error('Failed to fetch current air quality:', error)
+      showToast.error('Failed to load current air quality data')
+    },
+    staleTime: 2 * 60 * 1000, // Consider data stale after 2 minutes
+    ...options,
+  })
+}
+
 export const useForecast = (lat, lon, hours = 72, options = {}) => {
   return useQuery({
     queryKey: ['airQuality', 'forecast', lat, lon, hours],
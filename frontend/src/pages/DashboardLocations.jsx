@@ -4,12 +4,10 @@ import Button from '../components/ui/Button'
 import AQIBadge from '../components/ui/AQIBadge'
 import { MapPin, Plus, Trash2, Star } from 'lucide-react'
 import { useLocationStore } from '../store/useStore'
-import { useCurrentAirQuality } from '../hooks/useAirQuality'
+import { useCurrentAirQualityBatch } from '../hooks/useAirQuality'
 import { showToast } from '../components/ui/Toast'
 
-const LocationCard = ({ location, onSelect, onRemove, isActive }) => {
-  const { data } = useCurrentAirQuality(location.lat, location.lon)
-
+const LocationCard = ({ location, data, onSelect, onRemove, isActive }) => {
   return (
     <Card 
       hover
@@ -71,6 +69,9 @@ const DashboardLocations = ({ currentLocation, onLocationChange }) => {
   const [newLocation, setNewLocation] = useState({ name: '', lat: '', lon: '' })
   
   const { savedLocations, addLocation, removeLocation, setCurrentLocation } = useLocationStore()
+  
+  // One request for every saved location; results come back in the same order
+  const { data: currentBatch } = useCurrentAirQualityBatch(savedLocations)
 
   const handleAddLocation = () => {
     if (newLocation.name && newLocation.lat && newLocation.lon) {
@@ -161,10 +162,11 @@ const DashboardLocations = ({ currentLocation, onLocationChange }) => {
 
       {/* Location Cards Grid */}
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
-        {savedLocations.map((location) => (
+        {savedLocations.map((location, index) => (
           <LocationCard
             key={location.id}
             location={location}
+            data={currentBatch?.results?.[index]?.success ? currentBatch.results[index] : null}
             onSelect={handleSelectLocation}
             onRemove={handleRemoveLocation}
             isActive={currentLocation?.id === location.id}
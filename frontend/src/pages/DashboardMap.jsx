@@ -1,6 +1,7 @@
 import React, { useState } from 'react'
 import { MapContainer, TileLayer, Marker, Popup, Circle, useMap } from 'react-leaflet'
 import { useSensors } from '../hooks/useAirQuality'
+import { API_BASE_URL } from '../services/api'
 import Card from '../components/ui/Card'
 import AQIBadge from '../components/ui/AQIBadge'
 import { Layers, Maximize2 } from 'lucide-react'
@@ -74,6 +75,16 @@ const DashboardMap = ({ currentLocation }) => {
             className="map-tiles"
           />
 
+          {/* AQI raster tiles rendered by the backend */}
+          {showHeatMap && (
+            <TileLayer
+              url={`${API_BASE_URL}/api/tiles/{z}/{x}/{y}`}
+              opacity={0.6}
+              maxNativeZoom={12}
+              zIndex={2}
+            />
+          )}
+
           {/* Current Location Marker */}
           <Marker position={center}>
             <Popup>
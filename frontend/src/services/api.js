@@ -1,6 +1,6 @@
 import axios from 'axios'
 
-const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8001'
+export const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8001'
 
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
@@ -78,6 +78,13 @@ export const airQualityAPI = {
     return apiClient.get('/api/current', { params })
   },
 
+  // Get current air quality for many locations in one request
+  getCurrentAQBatch: async (locations) => {
+    return apiClient.post('/api/current/batch', {
+      locations: locations.map(({ lat, lon, name }) => ({ lat, lon, name })),
+    })
+  },
+
   // Get forecast
   getForecast: async (lat, lon, hours = 72) => {
     return apiClient.get('/api/forecast', { params: { lat, lon, hours } })